@@ -0,0 +1,65 @@
+import threading
+from collections import deque
+
+from .caching import bump_namespace_version, get_namespace_version
+
+
+VERSION_NAMESPACE = "alternatives_graph"
+
+DEFAULT_MAX_DEPTH = 3
+
+
+class AlternativesGraph:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        # drug_id -> [(alternative_drug_id, note)]
+        self.edges = {}
+
+    def _build(self, version):
+        from .models import DrugAlternative
+
+        edges = {}
+        rows = DrugAlternative.objects.order_by("id").values_list("drug_id", "alternative_drug_id", "note")
+        for drug_id, alternative_drug_id, note in rows.iterator(chunk_size=2000):
+            edges.setdefault(drug_id, []).append((alternative_drug_id, note))
+        self.edges = edges
+        self.version = version
+
+    def ensure_current(self):
+        version = get_namespace_version(VERSION_NAMESPACE)
+        if version == self.version:
+            return
+        with self.lock:
+            if version != self.version:
+                self._build(version)
+
+    def reachable(self, drug_id, max_depth=DEFAULT_MAX_DEPTH):
+        # Breadth-first, so every drug is reported at its shortest distance
+        # together with the drug it was reached through.
+        self.ensure_current()
+        found = {}
+        queue = deque([(drug_id, 0)])
+        seen = set([drug_id])
+        with self.lock:
+            while queue:
+                current_id, depth = queue.popleft()
+                if depth >= max_depth:
+                    continue
+                for alternative_id, note in self.edges.get(current_id, ()):
+                    if alternative_id in seen:
+                        continue
+                    seen.add(alternative_id)
+                    found[alternative_id] = {
+                        "depth": depth + 1,
+                        "via_id": current_id if depth > 0 else None,
+                        "note": note,
+                    }
+                    queue.append((alternative_id, depth + 1))
+        return found
+
+    def invalidate(self):
+        bump_namespace_version(VERSION_NAMESPACE)
+
+
+alternatives_graph = AlternativesGraph()
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class PharmaShelfAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pharma_shelf_app'
+
+    def ready(self):
+        from django.core import checks as django_checks
+
+        from . import checks, db_connections
+
+        django_checks.register(checks.check_shared_cache)
+        django_checks.register(checks.check_atomic_throttle)
+        db_connections.connect_signals()
@@ -0,0 +1,214 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+
+# Thin layer over the configured Django cache backend (see CACHES in
+# settings.py) that the rest of the app goes through for repeated reads:
+#
+# - namespaces carry a version stamp, so bumping one invalidates every key
+#   in it at once, on every worker that shares the backend;
+# - get_or_compute lets only one caller per key run the computation while
+#   the others wait for its result (single-flight), so an expired hot key
+#   does not send every worker to MySQL at the same time;
+# - hits and misses are counted per namespace.
+#
+# TTLs are per call, falling back to the backend's TIMEOUT; the LRU limit is
+# the backend's MAX_ENTRIES option.
+
+MISSING = object()
+
+# how long a computation may hold the single-flight lock before another
+# caller takes over, and how long the others wait for it
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5.0
+LOCK_POLL_INTERVAL = 0.05
+
+# counts are added to the shared totals every this many records
+STATS_FLUSH_EVERY = 100
+
+
+def initial_version():
+    # Counting from the clock instead of 1 keeps a version that was evicted
+    # from the cache from starting over at a number whose entries may still
+    # be cached.
+    return int(time.time() * 1000000)
+
+
+def namespace_version_key(namespace):
+    return "ns:" + namespace + ":version"
+
+
+def rebump_key(namespace):
+    return "ns:" + namespace + ":rebump_at"
+
+
+def get_namespace_version(namespace):
+    return get_namespace_versions([namespace])[namespace]
+
+
+def get_namespace_versions(namespaces):
+    keys = []
+    for namespace in namespaces:
+        keys.append(namespace_version_key(namespace))
+        keys.append(rebump_key(namespace))
+    stored = cache.get_many(keys)
+    now = time.time()
+    versions = {}
+    for namespace in namespaces:
+        version = stored.get(namespace_version_key(namespace))
+        rebump_at = stored.get(rebump_key(namespace))
+        # whoever deletes the marker makes the follow-up bump
+        if rebump_at is not None and rebump_at <= now and cache.delete(rebump_key(namespace)):
+            version = increment_version(namespace)
+        if version is None:
+            cache.add(namespace_version_key(namespace), initial_version(), None)
+            version = cache.get(namespace_version_key(namespace))
+        versions[namespace] = version
+    return versions
+
+
+def increment_version(namespace):
+    key = namespace_version_key(namespace)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # the key expired or was evicted
+        cache.add(key, initial_version(), None)
+        return cache.incr(key)
+
+
+def bump_namespace_version(namespace):
+    version = increment_version(namespace)
+    if len(settings.DATABASE_REPLICAS) > 0:
+        # Entries cached from a replica that had not caught up with the write
+        # yet would otherwise stay under the new version, so bump once more
+        # when the replica lag window is over.
+        lag = settings.DB_REPLICA_LAG_SECONDS
+        cache.set(rebump_key(namespace), time.time() + lag, lag * 10 + 60)
+    return version
+
+
+def make_key(namespace, key):
+    return namespace + ":" + str(get_namespace_version(namespace)) + ":" + str(key)
+
+
+def add_to_counter(key, amount):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        cache.set(key, amount, None)
+
+
+class SharedCounters:
+    # Counters kept per process and added to totals in the cache every
+    # STATS_FLUSH_EVERY records, so counting does not cost a cache round trip
+    # each time. The totals cover every worker sharing the backend, once that
+    # worker has flushed.
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.records = 0
+
+    def names_key(self):
+        return self.prefix + ":names"
+
+    def counter_key(self, name):
+        return self.prefix + ":count:" + name
+
+    def record(self, name, amount=1):
+        with self.lock:
+            self.pending[name] = self.pending.get(name, 0) + amount
+            self.records += 1
+            if self.records < STATS_FLUSH_EVERY:
+                return
+            pending = self.pending
+            self.pending = {}
+            self.records = 0
+        self.flush(pending)
+
+    def flush(self, pending=None):
+        if pending is None:
+            with self.lock:
+                pending = self.pending
+                self.pending = {}
+                self.records = 0
+
+        if len(pending) == 0:
+            return
+        names = cache.get(self.names_key(), [])
+        if not set(pending).issubset(names):
+            cache.set(self.names_key(), sorted(set(names) | set(pending)), None)
+        for name in pending:
+            if pending[name] > 0:
+                add_to_counter(self.counter_key(name), pending[name])
+
+    def get_totals(self):
+        self.flush()
+        names = cache.get(self.names_key(), [])
+        values = cache.get_many([self.counter_key(name) for name in names])
+        return {name: values.get(self.counter_key(name), 0) for name in names}
+
+    def reset(self):
+        self.flush()
+        names = cache.get(self.names_key(), [])
+        cache.delete_many([self.names_key()] + [self.counter_key(name) for name in names])
+
+
+# counter names are "<namespace>:hits" and "<namespace>:misses"
+stats = SharedCounters("cache_stats")
+
+
+def get_stats():
+    report = {}
+    for name, value in stats.get_totals().items():
+        namespace, outcome = name.rsplit(":", 1)
+        report.setdefault(namespace, {"hits": 0, "misses": 0})[outcome] = value
+    for namespace in report:
+        hits = report[namespace]["hits"]
+        misses = report[namespace]["misses"]
+        total = hits + misses
+        report[namespace]["hit_rate"] = hits / float(total) if total else 0.0
+    return report
+
+
+def reset_stats():
+    stats.reset()
+
+
+def get_or_compute(namespace, key, compute, timeout=DEFAULT_TIMEOUT):
+    full_key = make_key(namespace, key)
+
+    value = cache.get(full_key, MISSING)
+    if value is not MISSING:
+        stats.record(namespace + ":hits")
+        return value
+    stats.record(namespace + ":misses")
+
+    lock_key = full_key + ":lock"
+    if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        # someone else is computing it; wait for their result, then fall
+        # back to computing it here rather than failing the request
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            value = cache.get(full_key, MISSING)
+            if value is not MISSING:
+                return value
+        return compute()
+
+    try:
+        value = compute()
+        cache.set(full_key, value, timeout)
+    finally:
+        cache.delete(lock_key)
+    return value
+
+
+def invalidate(namespace):
+    return bump_namespace_version(namespace)
@@ -0,0 +1,207 @@
+import codecs
+import csv
+import io
+import json
+import uuid
+
+from django.db import transaction
+
+from . import fragments, models, search
+
+
+DRUG_FIELDS = ["name", "active_ingredient", "dosage_form", "indications", "side_effects", "stock_quantity"]
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Only the first errors are kept for the report, so a bad file cannot grow
+# memory with one message per row.
+MAX_REPORTED_ERRORS = 100
+
+
+def iter_csv_rows(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield row
+
+
+def iter_ndjson_rows(stream):
+    for line in stream:
+        line = line.strip()
+        if len(line) == 0:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield None
+            continue
+        if not isinstance(row, dict):
+            yield None
+            continue
+        yield row
+
+
+def iter_rows(stream, file_format):
+    if file_format == "ndjson":
+        return iter_ndjson_rows(stream)
+    return iter_csv_rows(stream)
+
+
+def is_utf8(binary_file, chunk_size=64 * 1024):
+    # Checked before anything is imported: batches are committed as the file
+    # streams in, so a decoding error halfway would leave a partial import.
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        while True:
+            chunk = binary_file.read(chunk_size)
+            if len(chunk) == 0:
+                decoder.decode(b"", final=True)
+                return True
+            decoder.decode(chunk)
+    except UnicodeDecodeError:
+        return False
+    finally:
+        binary_file.seek(0)
+
+
+def open_text_stream(binary_file):
+    return io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+
+
+def row_to_post_data(row):
+    post_data = {}
+    for field in DRUG_FIELDS + ["category"]:
+        value = row.get(field)
+        if value is None:
+            value = ""
+        post_data[field] = str(value).strip()
+    return post_data
+
+
+class CategoryCache:
+    def __init__(self):
+        self.ids = {}
+        for category_id, name in models.Category.objects.values_list("id", "name"):
+            self.ids.setdefault(name.strip().lower(), category_id)
+        self.created = 0
+
+    def resolve(self, name):
+        key = name.lower()
+        if key not in self.ids:
+            category = models.create_category({"name": name, "description": ""})
+            self.ids[key] = category.id
+            self.created += 1
+        return self.ids[key]
+
+
+class CatalogImporter:
+    def __init__(self, created_by_id, batch_size=DEFAULT_BATCH_SIZE):
+        self.created_by_id = created_by_id
+        self.batch_size = batch_size
+        self.categories = CategoryCache()
+        self.batch = []
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+
+    def add_error(self, row_number, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append("Row " + str(row_number) + ": " + message)
+
+    def add_row(self, row_number, row):
+        if row is None:
+            self.add_error(row_number, "not a JSON object.")
+            return
+
+        post_data = row_to_post_data(row)
+        errors = models.Drug.objects.validate_drug(post_data)
+        if len(post_data["category"]) == 0:
+            errors["category"] = "Category is required."
+        elif len(post_data["category"]) > 100:
+            errors["category"] = "Category name should be at most 100 characters long."
+        if len(errors) > 0:
+            self.add_error(row_number, " ".join(errors.values()))
+            return
+
+        stock_quantity = 0
+        if len(post_data["stock_quantity"]) > 0:
+            stock_quantity = int(post_data["stock_quantity"])
+
+        self.batch.append(
+            models.Drug(
+                name=post_data["name"],
+                active_ingredient=post_data["active_ingredient"],
+                dosage_form=post_data["dosage_form"],
+                indications=post_data["indications"],
+                side_effects=post_data["side_effects"],
+                stock_quantity=stock_quantity,
+                created_by_id=self.created_by_id,
+                category_id=self.categories.resolve(post_data["category"]),
+            )
+        )
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.batch) == 0:
+            return
+
+        in_stock = 0
+        per_category = {}
+        for drug in self.batch:
+            if drug.stock_quantity > 0:
+                in_stock += 1
+            per_category[drug.category_id] = per_category.get(drug.category_id, 0) + 1
+
+        batch_key = uuid.uuid4().hex
+        for drug in self.batch:
+            drug.import_batch = batch_key
+
+        with transaction.atomic():
+            models.Drug.objects.bulk_create(self.batch, batch_size=self.batch_size)
+            self.set_missing_ids(batch_key)
+            movements = []
+            for drug in self.batch:
+                if drug.stock_quantity > 0:
+                    movements.append(models.StockMovement(drug_id=drug.id, change=drug.stock_quantity, reason="initial"))
+            models.StockMovement.objects.bulk_create(movements, batch_size=self.batch_size)
+            models.bump_inventory_counter("drugs", len(self.batch))
+            models.bump_inventory_counter("drugs_in_stock", in_stock)
+            models.bump_inventory_counter("drugs_out_of_stock", len(self.batch) - in_stock)
+            for category_id in per_category:
+                models.bump_category_counter(category_id, per_category[category_id])
+            fragments.bump_fragment_version_on_commit("catalog")
+            # bulk_create bypasses create_drug, so every worker rebuilds its
+            # search index on the next search
+            transaction.on_commit(search.drug_index.invalidate)
+
+        self.imported += len(self.batch)
+        self.batch = []
+
+    def set_missing_ids(self, batch_key):
+        # MySQL does not return the ids of bulk inserted rows, so they are
+        # read back by this batch's key. Each INSERT numbers its rows in
+        # order, and the batch's INSERTs run one after another.
+        if all(drug.id is not None for drug in self.batch):
+            return
+        ids = list(models.Drug.objects.filter(import_batch=batch_key).order_by("id").values_list("id", flat=True))
+        for drug, drug_id in zip(self.batch, ids):
+            drug.id = drug_id
+
+    def run(self, rows):
+        row_number = 0
+        for row in rows:
+            row_number += 1
+            self.add_row(row_number, row)
+        self.flush()
+        return {
+            "imported": self.imported,
+            "skipped": self.skipped,
+            "categories_created": self.categories.created,
+            "errors": self.errors,
+        }
+
+
+def import_catalog(stream, file_format, created_by_id, batch_size=DEFAULT_BATCH_SIZE):
+    importer = CatalogImporter(created_by_id, batch_size)
+    return importer.run(iter_rows(stream, file_format))
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.checks import Error, Warning
+
+
+# backends whose incr is a single server-side operation; the others read the
+# value and write it back
+ATOMIC_COUNTER_BACKENDS = [
+    "django.core.cache.backends.memcached.PyMemcacheCache",
+    "django.core.cache.backends.memcached.PyLibMCCache",
+    "django.core.cache.backends.memcached.MemcachedCache",
+    "django_redis.cache.RedisCache",
+]
+
+
+def check_shared_cache(app_configs, **kwargs):
+    # Version stamps, fragment and snapshot invalidation, the login throttle
+    # and the stats commands all rely on every worker seeing the same cache.
+    if settings.CACHE_BACKEND == "locmem" and settings.WEB_CONCURRENCY > 1:
+        return [
+            Error(
+                "CACHE_BACKEND=locmem keeps a separate cache in each of the %d workers, "
+                "so a write only invalidates cached data in the worker that made it."
+                % settings.WEB_CONCURRENCY,
+                hint="Use CACHE_BACKEND=file, memcached or database.",
+                id="pharma_shelf_app.E001",
+            )
+        ]
+    return []
+
+
+def check_atomic_throttle(app_configs, **kwargs):
+    # The login throttle counts failures with cache.incr. On the other
+    # backends concurrent failures can overwrite each other's increment, so
+    # a burst of guesses gets past the limit.
+    backend = settings.CACHES["default"]["BACKEND"]
+    if backend in ATOMIC_COUNTER_BACKENDS:
+        return []
+    if backend == settings.CACHE_BACKENDS["locmem"] and settings.WEB_CONCURRENCY == 1:
+        # one process, and LocMemCache increments under a lock
+        return []
+    return [
+        Warning(
+            "The login throttle counts failures on %s, whose counters are not atomic, "
+            "so concurrent failed logins can be undercounted." % backend,
+            hint="Use CACHE_BACKEND=memcached, or a Redis backend, in production.",
+            id="pharma_shelf_app.W001",
+        )
+    ]
@@ -0,0 +1,92 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib import messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import models
+
+
+# ETag / Last-Modified support for the catalog pages. The validators are
+# computed from cheap stamps (fragment versions, one aggregate query for a
+# drug) so an unchanged page answers 304 before its main queries run.
+
+def make_etag(parts):
+    digest = hashlib.md5("|".join([str(part) for part in parts]).encode()).hexdigest()
+    return '"' + digest + '"'
+
+
+def get_user_parts(request, current_user):
+    # The pages show the user's name and role and carry a CSRF token, so
+    # the validators are per user and per CSRF cookie. A copy showing flash
+    # messages gets its own ETag, so it is never revalidated as current.
+    return [
+        current_user.id,
+        current_user.name,
+        current_user.role,
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""),
+        len(messages.get_messages(request)) > 0,
+    ]
+
+
+def get_drugs_list_validators(request, current_user, fragment_versions):
+    etag = make_etag(
+        ["drugs", fragment_versions["catalog"], fragment_versions["categories"], request.get_full_path()]
+        + get_user_parts(request, current_user)
+    )
+    return etag, None
+
+
+def get_categories_validators(request, current_user, fragment_versions):
+    etag = make_etag(
+        ["categories", fragment_versions["catalog"], fragment_versions["categories"]]
+        + get_user_parts(request, current_user)
+    )
+    return etag, None
+
+
+def get_drug_details_validators(request, current_user, fragment_versions, drug_id):
+    stamp = models.get_drug_details_stamp(drug_id)
+    if stamp is None:
+        return None, None
+
+    last_modified = stamp["updated_at"]
+    for key in ["alternatives_updated_at", "alternative_drugs_updated_at"]:
+        if stamp[key] is not None and stamp[key] > last_modified:
+            last_modified = stamp[key]
+
+    parts = ["drug_details", drug_id, stamp["stock_quantity"], stamp["alternative_count"], last_modified.isoformat()]
+    if stamp["stock_quantity"] <= 0:
+        # in-stock substitutes reach past the direct alternatives
+        parts.append(fragment_versions["catalog"])
+    return make_etag(parts + get_user_parts(request, current_user)), last_modified
+
+
+def get_not_modified_response(request, etag, last_modified):
+    if etag is None:
+        return None
+    if request.method not in ("GET", "HEAD"):
+        return None
+    # a page with flash messages to show is never "not modified"
+    if len(messages.get_messages(request)) > 0:
+        return None
+
+    timestamp = None
+    if last_modified is not None:
+        timestamp = int(last_modified.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    if etag is None:
+        return response
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    # per-user pages: browsers may keep them but must revalidate every time
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,94 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+
+from .caching import SharedCounters
+
+
+# Django keeps one connection per thread, so with CONN_MAX_AGE set the
+# threads that run queries are the connection pool: the request thread under
+# WSGI, plus under ASGI the thread running sync code and this executor, which
+# the async views run their queries on. Its size caps the connections a
+# process opens no matter how many requests are in flight; a query waits for
+# a free thread instead (the pool wait below).
+#
+# Django 3.2 has no CONN_HEALTH_CHECKS, so a kept connection that has sat
+# idle for DB_HEALTH_CHECK_IDLE_SECONDS is pinged here before a request or
+# pooled query reuses it. Busy connections are not pinged; if one does drop,
+# the failing query marks it and close_old_connections replaces it.
+executor = ThreadPoolExecutor(max_workers=settings.DB_POOL_SIZE, thread_name_prefix="db")
+
+# pool waits longer than this are also counted as slow
+SLOW_WAIT_SECONDS = 0.1
+
+STAT_NAMES = ["opened", "reused", "health_check_failures", "pool_waits", "pool_wait_us", "slow_pool_waits"]
+
+stats = SharedCounters("db_connections")
+
+
+def check_connections(**kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        idle = now - getattr(connection, "last_used_at", now)
+        connection.last_used_at = now
+        if settings.DB_CONN_HEALTH_CHECKS and idle >= settings.DB_HEALTH_CHECK_IDLE_SECONDS:
+            if not connection.is_usable():
+                connection.close()
+                stats.record("health_check_failures")
+                continue
+        stats.record("reused")
+
+
+def count_opened(sender, connection, **kwargs):
+    stats.record("opened")
+
+
+def connect_signals():
+    # request_started also reaches the thread running sync code under ASGI
+    request_started.connect(check_connections, dispatch_uid="db_connections.check_connections")
+    connection_created.connect(count_opened, dispatch_uid="db_connections.count_opened")
+
+
+async def run_in_pool(func, *args):
+    submitted = time.perf_counter()
+
+    def call():
+        waited = time.perf_counter() - submitted
+        stats.record("pool_waits")
+        stats.record("pool_wait_us", int(waited * 1000000))
+        if waited > SLOW_WAIT_SECONDS:
+            stats.record("slow_pool_waits")
+
+        check_connections()
+        try:
+            return func(*args)
+        finally:
+            # closes connections past CONN_MAX_AGE or left broken; no round
+            # trip unless a query failed
+            close_old_connections()
+
+    # the copied context carries the request's replica routing state
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, context.run, call)
+
+
+def get_stats():
+    totals = stats.get_totals()
+    report = {name: totals.get(name, 0) for name in STAT_NAMES}
+    report["average_pool_wait_ms"] = 0.0
+    if report["pool_waits"] > 0:
+        report["average_pool_wait_ms"] = report["pool_wait_us"] / 1000.0 / report["pool_waits"]
+    return report
+
+
+def reset_stats():
+    stats.reset()
@@ -0,0 +1,58 @@
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import connections
+
+
+# Reads go to a replica only inside GET and HEAD requests (see
+# ReplicaReadMiddleware); everything else, including management commands,
+# reads and writes the primary.
+#
+# A request that writes gets a PRIMARY_COOKIE that keeps the same client's
+# reads on the primary for DB_REPLICA_LAG_SECONDS, so the page a form
+# redirects to shows the write. Other clients keep reading the replicas;
+# cached data they fill from a lagging replica is dropped by the second
+# version bump caching.py makes once the lag window has passed.
+PRIMARY_COOKIE = "read_primary_until"
+
+# {"use_primary": bool, "wrote": bool} for the current request; a dict so
+# writes in threads running a copy of the context still reach the request
+request_state = contextvars.ContextVar("db_router_request_state", default=None)
+
+
+def record_write():
+    state = request_state.get()
+    if state is not None:
+        state["use_primary"] = True
+        state["wrote"] = True
+
+
+def is_cache_table(model):
+    # DatabaseCache stores its entries through the router too
+    return model._meta.app_label == "django_cache"
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if len(settings.DATABASE_REPLICAS) == 0 or is_cache_table(model):
+            return "default"
+        state = request_state.get()
+        if state is None or state["use_primary"]:
+            return "default"
+        # select_for_update and reads after a write inside a transaction
+        if connections["default"].in_atomic_block:
+            return "default"
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        if not is_cache_table(model):
+            record_write()
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from . import fragments, models
+
+
+# Movements that take stock off the shelf; receipts, initial stock and
+# corrections upwards are not demand.
+CONSUMPTION_REASONS = ["dispense", "adjustment", "bulk_update", "edit"]
+
+
+def load_consumption(since):
+    rows = models.StockMovement.objects.filter(
+        created_at__gte=since,
+        change__lt=0,
+        reason__in=CONSUMPTION_REASONS
+    ).values_list("drug_id", "change")
+
+    drug_ids = []
+    changes = []
+    for drug_id, change in rows.iterator(chunk_size=5000):
+        drug_ids.append(drug_id)
+        changes.append(change)
+    return np.array(drug_ids, dtype=np.int64), np.array(changes, dtype=np.float64)
+
+
+def load_stock():
+    rows = models.Drug.objects.order_by("id").values_list("id", "stock_quantity")
+    drug_ids = []
+    stock = []
+    for drug_id, stock_quantity in rows.iterator(chunk_size=5000):
+        drug_ids.append(drug_id)
+        stock.append(stock_quantity)
+    return np.array(drug_ids, dtype=np.int64), np.array(stock, dtype=np.float64)
+
+
+def compute_forecast_arrays(drug_ids, stock, movement_drug_ids, movement_changes, window_days, cover_days):
+    # drug_ids is sorted, so every movement can be mapped to its drug's row
+    # with a binary search and the per-drug totals summed in one bincount.
+    consumed = np.zeros(len(drug_ids), dtype=np.float64)
+    if len(movement_drug_ids) > 0 and len(drug_ids) > 0:
+        rows = np.searchsorted(drug_ids, movement_drug_ids)
+        rows = np.clip(rows, 0, len(drug_ids) - 1)
+        known = drug_ids[rows] == movement_drug_ids
+        consumed = np.bincount(rows[known], weights=-movement_changes[known], minlength=len(drug_ids))
+
+    daily_consumption = consumed / float(window_days)
+
+    days_of_supply = np.full(len(drug_ids), np.nan)
+    consuming = daily_consumption > 0
+    days_of_supply[consuming] = np.maximum(stock[consuming], 0) / daily_consumption[consuming]
+
+    target_stock = daily_consumption * float(cover_days)
+    reorder_quantity = np.ceil(np.maximum(target_stock - np.maximum(stock, 0), 0)).astype(np.int64)
+    return daily_consumption, days_of_supply, reorder_quantity
+
+
+def compute_forecasts(window_days=30, lead_time_days=7, safety_days=7):
+    now = timezone.now()
+    movement_drug_ids, movement_changes = load_consumption(now - timedelta(days=window_days))
+    drug_ids, stock = load_stock()
+
+    daily_consumption, days_of_supply, reorder_quantity = compute_forecast_arrays(
+        drug_ids,
+        stock,
+        movement_drug_ids,
+        movement_changes,
+        window_days,
+        lead_time_days + safety_days,
+    )
+
+    forecasts = []
+    for i in range(len(drug_ids)):
+        supply = None
+        if not np.isnan(days_of_supply[i]):
+            supply = round(float(days_of_supply[i]), 2)
+        forecasts.append(
+            models.DrugForecast(
+                drug_id=int(drug_ids[i]),
+                daily_consumption=round(float(daily_consumption[i]), 4),
+                days_of_supply=supply,
+                reorder_quantity=int(reorder_quantity[i]),
+                computed_at=now,
+            )
+        )
+
+    with transaction.atomic():
+        models.DrugForecast.objects.all().delete()
+        models.DrugForecast.objects.bulk_create(forecasts, batch_size=1000)
+        fragments.bump_fragment_version_on_commit("catalog")
+    return len(forecasts)
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject
+
+from . import caching
+
+
+# Cached template fragments take the current version of what they show as
+# a {% cache %} vary-on argument, so a write only has to bump the version
+# for every page to render the fragment afresh; the old entries just expire.
+#
+# "catalog" covers drugs, stock, alternatives, interactions and forecasts,
+# "categories" covers the category list.
+#
+# Views hand data shown only inside a fragment to the template through
+# lazy(), so it is loaded when the template first reads it: on a cache hit
+# the fragment's queries do not run at all.
+FRAGMENT_TIMEOUT = 24 * 60 * 60
+
+# With the per-process locmem cache a bump only reaches the worker that made
+# the write, so fragments expire quickly to bound how long the other workers
+# keep serving the old ones.
+LOCAL_CACHE_FRAGMENT_TIMEOUT = 30
+
+VERSION_NAMES = ["catalog", "categories"]
+
+
+def namespace(name):
+    return "fragments:" + name
+
+
+def get_fragment_timeout():
+    if settings.CACHE_BACKEND == "locmem":
+        return LOCAL_CACHE_FRAGMENT_TIMEOUT
+    return FRAGMENT_TIMEOUT
+
+
+def get_fragment_versions():
+    versions = caching.get_namespace_versions([namespace(name) for name in VERSION_NAMES])
+    context = {"timeout": get_fragment_timeout()}
+    for name in VERSION_NAMES:
+        context[name] = versions[namespace(name)]
+    return context
+
+
+def lazy(func, *args):
+    return SimpleLazyObject(lambda: func(*args))
+
+
+def bump_fragment_version(name):
+    return caching.bump_namespace_version(namespace(name))
+
+
+def bump_fragment_version_on_commit(name):
+    # Bumping after the commit means a reader can never cache data from
+    # before the write under the new version.
+    transaction.on_commit(lambda: bump_fragment_version(name))
@@ -0,0 +1,74 @@
+import threading
+
+from .caching import bump_namespace_version, get_namespace_version
+
+
+VERSION_NAMESPACE = "interaction_graph"
+
+
+def canonical_pair(drug_a_id, drug_b_id):
+    if drug_a_id < drug_b_id:
+        return (drug_a_id, drug_b_id)
+    return (drug_b_id, drug_a_id)
+
+
+class InteractionGraph:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        # (min_id, max_id) -> [DrugInteraction]
+        self.pairs = {}
+        # drug_id -> set of drug ids it interacts with
+        self.adjacency = {}
+
+    def _add(self, interaction):
+        pair = canonical_pair(interaction.drug_a_id, interaction.drug_b_id)
+        if pair not in self.pairs:
+            self.pairs[pair] = []
+        self.pairs[pair].append(interaction)
+        self.adjacency.setdefault(pair[0], set()).add(pair[1])
+        self.adjacency.setdefault(pair[1], set()).add(pair[0])
+
+    def _build(self, version):
+        from .models import DrugInteraction
+
+        self.pairs = {}
+        self.adjacency = {}
+        interactions = DrugInteraction.objects.select_related("drug_a", "drug_b").iterator(chunk_size=2000)
+        for interaction in interactions:
+            self._add(interaction)
+        self.version = version
+
+    def ensure_current(self):
+        version = get_namespace_version(VERSION_NAMESPACE)
+        if version == self.version:
+            return
+        with self.lock:
+            if version != self.version:
+                self._build(version)
+
+    def get_interactions(self, drug_ids):
+        self.ensure_current()
+        drug_ids = set(drug_ids)
+        interactions = []
+        with self.lock:
+            for drug_id in drug_ids:
+                for other_id in self.adjacency.get(drug_id, ()):
+                    if other_id in drug_ids and drug_id < other_id:
+                        interactions.extend(self.pairs[(drug_id, other_id)])
+        return interactions
+
+    def add_interaction(self, interaction):
+        new_version = bump_namespace_version(VERSION_NAMESPACE)
+        with self.lock:
+            # patch in place only when no other worker changed the table since
+            # this graph was loaded; otherwise the next read rebuilds it
+            if self.version is not None and self.version == new_version - 1:
+                self._add(interaction)
+                self.version = new_version
+
+    def invalidate(self):
+        bump_namespace_version(VERSION_NAMESPACE)
+
+
+interaction_graph = InteractionGraph()
@@ -0,0 +1,202 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+from django.urls import path
+
+from pharma_shelf_app import models, urls, views
+
+
+class SyncReadViews:
+    urlpatterns = [
+        path("dashboard/", views.dashboard),
+        path("drugs/", views.drugs_list),
+        path("drugs/<int:drug_id>/", views.drug_details),
+        path("interactions/check/", views.interaction_checker),
+    ] + urls.urlpatterns
+
+
+class AsyncReadViews:
+    urlpatterns = [
+        path("dashboard/", views.async_dashboard),
+        path("drugs/", views.async_drugs_list),
+        path("drugs/<int:drug_id>/", views.async_drug_details),
+        path("interactions/check/", views.async_interaction_checker),
+    ] + urls.urlpatterns
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+class QueryLatency:
+    # Sleeps before every query, standing in for the network round trip to a
+    # remote database when benchmarking against a local one.
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+    def add_to(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync and async read views under concurrent load against "
+        "the configured database: the sync views through the WSGI handler on "
+        "one thread per request in flight, as a threaded WSGI server runs "
+        "them, and the async views through the ASGI handler on one event loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--email",
+            required=True,
+            help="Email of the user the requests are logged in as.",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=200,
+            help="Requests sent per mode (default: 200).",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=20,
+            help="Requests in flight at the same time (default: 20).",
+        )
+        parser.add_argument(
+            "--mode",
+            choices=["both", "sync", "async"],
+            default="both",
+            help="Views to benchmark (default: both).",
+        )
+        parser.add_argument(
+            "--query-latency-ms",
+            type=float,
+            default=0,
+            help="Delay added to every query, to model a database across the network (default: 0).",
+        )
+
+    def get_urls(self):
+        drug_ids = list(models.Drug.objects.order_by("id").values_list("id", flat=True)[:3])
+        if len(drug_ids) == 0:
+            raise CommandError("The catalog is empty; add some drugs before benchmarking.")
+
+        regimen = ",".join([str(drug_id) for drug_id in drug_ids])
+        return [
+            "/dashboard/",
+            "/drugs/",
+            "/drugs/?page=2",
+            "/drugs/%d/" % drug_ids[0],
+            "/interactions/check/?drug_ids=" + regimen,
+        ]
+
+    def run_sync_load(self, session_key, request_urls, total, concurrency):
+        # a client per thread, like the request threads of a WSGI server
+        local = threading.local()
+        latencies = []
+        failures = []
+
+        def send(url):
+            if not hasattr(local, "client"):
+                local.client = Client()
+                local.client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+            started = time.perf_counter()
+            response = local.client.get(url)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                failures.append("%s -> %d" % (url, response.status_code))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(send, [request_urls[i % len(request_urls)] for i in range(total)]))
+        return time.perf_counter() - started, latencies, failures
+
+    async def send_async_load(self, session_key, request_urls, total, concurrency):
+        client = AsyncClient()
+        client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        failures = []
+
+        async def send(url):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(url)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    failures.append("%s -> %d" % (url, response.status_code))
+
+        started = time.perf_counter()
+        await asyncio.gather(*[send(request_urls[i % len(request_urls)]) for i in range(total)])
+        return time.perf_counter() - started, latencies, failures
+
+    def run_async_load(self, session_key, request_urls, total, concurrency):
+        return asyncio.run(self.send_async_load(session_key, request_urls, total, concurrency))
+
+    def handle(self, *args, **options):
+        users = models.get_user_by_email(options["email"])
+        if len(users) == 0:
+            raise CommandError("No user with email " + options["email"] + ".")
+
+        request_urls = self.get_urls()
+
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session["user_id"] = users[0].id
+        session.save()
+
+        modes = [("sync", SyncReadViews, self.run_sync_load), ("async", AsyncReadViews, self.run_async_load)]
+        if options["mode"] != "both":
+            modes = [mode for mode in modes if mode[0] == options["mode"]]
+
+        latency = QueryLatency(options["query_latency_ms"] / 1000.0)
+        if latency.seconds > 0:
+            connection_created.connect(latency.add_to)
+            for connection in connections.all():
+                latency.add_to(connection=connection)
+
+        try:
+            for name, urlconf, run_load in modes:
+                # the test client sends Host: testserver
+                with override_settings(ROOT_URLCONF=urlconf, ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ["testserver"]):
+                    # one untimed pass loads the in-process graphs and caches
+                    run_load(session.session_key, request_urls, len(request_urls), 1)
+                    elapsed, latencies, failures = run_load(
+                        session.session_key, request_urls, options["requests"], options["concurrency"]
+                    )
+
+                if len(failures) > 0:
+                    for failure in failures[:10]:
+                        self.stderr.write(failure)
+                    raise CommandError(
+                        "%d of %d %s requests failed; no throughput reported." % (len(failures), len(latencies), name)
+                    )
+                self.stdout.write(
+                    "%-5s %6d requests in %6.2fs  %8.1f req/s  p50 %7.1fms  p95 %7.1fms"
+                    % (
+                        name,
+                        len(latencies),
+                        elapsed,
+                        len(latencies) / elapsed,
+                        percentile(latencies, 0.5) * 1000,
+                        percentile(latencies, 0.95) * 1000,
+                    )
+                )
+        finally:
+            connection_created.disconnect(latency.add_to)
+            session.delete()
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from pharma_shelf_app import caching
+
+
+class Command(BaseCommand):
+    help = (
+        "Print cache hits, misses and hit rate per namespace. "
+        "Totals are read from the shared cache, and each worker adds its counts every "
+        "100 events; with CACHE_BACKEND=locmem this command runs in its own process "
+        "and always reports zeros."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Reset the counters to zero after printing them.",
+        )
+
+    def handle(self, *args, **options):
+        stats = caching.get_stats()
+        for namespace in sorted(stats):
+            self.stdout.write(
+                "%-30s hits %8d  misses %8d  hit rate %5.1f%%"
+                % (
+                    namespace,
+                    stats[namespace]["hits"],
+                    stats[namespace]["misses"],
+                    stats[namespace]["hit_rate"] * 100,
+                )
+            )
+        if options["reset"]:
+            caching.reset_stats()
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pharma_shelf_app import forecasting
+
+
+class Command(BaseCommand):
+    help = "Compute daily consumption, days of supply and reorder quantities for every drug."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--window-days",
+            type=int,
+            default=30,
+            help="Days of stock movements used to estimate consumption (default: 30).",
+        )
+        parser.add_argument(
+            "--lead-time-days",
+            type=int,
+            default=7,
+            help="Days a reorder takes to arrive (default: 7).",
+        )
+        parser.add_argument(
+            "--safety-days",
+            type=int,
+            default=7,
+            help="Extra days of demand to keep as safety stock (default: 7).",
+        )
+
+    def handle(self, *args, **options):
+        if options["window_days"] < 1:
+            raise CommandError("--window-days must be at least 1.")
+        if options["lead_time_days"] < 0 or options["safety_days"] < 0:
+            raise CommandError("--lead-time-days and --safety-days cannot be negative.")
+
+        count = forecasting.compute_forecasts(
+            window_days=options["window_days"],
+            lead_time_days=options["lead_time_days"],
+            safety_days=options["safety_days"],
+        )
+        self.stdout.write(self.style.SUCCESS("Stored forecasts for %d drugs." % count))
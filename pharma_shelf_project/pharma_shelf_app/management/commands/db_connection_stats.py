@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pharma_shelf_app import db_connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Print database connection counters: connections opened and reused, failed health checks and pool waits. "
+        "Totals are read from the shared cache, and each worker adds its counts every "
+        "100 events; with CACHE_BACKEND=locmem this command runs in its own process "
+        "and always reports zeros."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Reset the counters to zero after printing them.",
+        )
+
+    def handle(self, *args, **options):
+        stats = db_connections.get_stats()
+        self.stdout.write("pool_size %d" % settings.DB_POOL_SIZE)
+        self.stdout.write("conn_max_age %d" % settings.DB_CONN_MAX_AGE)
+        for name in db_connections.STAT_NAMES:
+            self.stdout.write("%s %d" % (name, stats[name]))
+        self.stdout.write("average_pool_wait_ms %.2f" % stats["average_pool_wait_ms"])
+        if options["reset"]:
+            db_connections.reset_stats()
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pharma_shelf_app import catalog_import, models
+
+
+class Command(BaseCommand):
+    help = "Import drugs from a CSV or NDJSON supplier catalog in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Catalog file to import.")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "ndjson"],
+            help="File format; guessed from the file extension when omitted.",
+        )
+        parser.add_argument(
+            "--created-by",
+            required=True,
+            help="Email of the user recorded as creator of the imported drugs.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=catalog_import.DEFAULT_BATCH_SIZE,
+            help="Rows inserted per bulk_create (default: %d)." % catalog_import.DEFAULT_BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        users = models.get_user_by_email(options["created_by"])
+        if len(users) == 0:
+            raise CommandError("No user with email " + options["created_by"] + ".")
+
+        file_format = options["format"]
+        if file_format is None:
+            file_format = "csv"
+            if options["path"].endswith((".ndjson", ".jsonl")):
+                file_format = "ndjson"
+
+        with open(options["path"], "rb") as binary_file:
+            if not catalog_import.is_utf8(binary_file):
+                raise CommandError(options["path"] + " is not UTF-8 encoded text; nothing was imported.")
+            stream = catalog_import.open_text_stream(binary_file)
+            result = catalog_import.import_catalog(stream, file_format, users[0].id, options["batch_size"])
+
+        for error in result["errors"]:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            "Imported %d drugs, skipped %d rows, created %d categories."
+            % (result["imported"], result["skipped"], result["categories_created"])
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from pharma_shelf_app import throttling
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the login throttling counters (attempts, failures, throttled, lockouts). "
+        "Totals are read from the shared cache, and each worker adds its counts every "
+        "100 events; with CACHE_BACKEND=locmem this command runs in its own process "
+        "and always reports zeros."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Reset the counters to zero after printing them.",
+        )
+
+    def handle(self, *args, **options):
+        stats = throttling.get_stats()
+        for name in throttling.STAT_NAMES:
+            self.stdout.write("%s %d" % (name, stats[name]))
+        if options["reset"]:
+            throttling.reset_stats()
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pharma_shelf_app import models
+
+
+class Command(BaseCommand):
+    help = "Rebuild the dashboard inventory counters from a full recount and verify them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify-only",
+            action="store_true",
+            help="Only compare the stored counters with a full recount, without rewriting them.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["verify_only"]:
+            counts, category_counts = models.rebuild_inventory_counters()
+            self.stdout.write(
+                "Rebuilt %d inventory counters and %d category counters."
+                % (len(counts), len(category_counts))
+            )
+
+        mismatches = models.verify_inventory_counters()
+        if len(mismatches) > 0:
+            for name, stored, expected in mismatches:
+                self.stderr.write("%s: stored=%s expected=%s" % (name, stored, expected))
+            raise CommandError("%d inventory counters do not match the recount." % len(mismatches))
+
+        self.stdout.write(self.style.SUCCESS("Inventory counters match the recount."))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pharma_shelf_app import notifications
+
+
+class Command(BaseCommand):
+    help = "Send queued notification jobs, coalescing out-of-stock events into one message per run."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running and drain the queue every --interval seconds.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=60,
+            help="Seconds between runs when --loop is given (default: 60).",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed, sent = notifications.process_notifications()
+            if processed > 0:
+                self.stdout.write("Processed %d jobs, sent %d messages." % (processed, sent))
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
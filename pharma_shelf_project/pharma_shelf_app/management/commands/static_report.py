@@ -0,0 +1,91 @@
+import json
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from pharma_shelf_app.storage import get_encoders
+
+
+def get_file_sizes(name):
+    sizes = {"raw": staticfiles_storage.size(name)}
+    for encoding, suffix, compress in get_encoders():
+        if staticfiles_storage.exists(name + suffix):
+            sizes[encoding] = staticfiles_storage.size(name + suffix)
+    # what a client that accepts every variant downloads
+    sizes["transfer"] = min(sizes.values())
+    return sizes
+
+
+class Command(BaseCommand):
+    help = "Report raw and compressed sizes of the collected static files, optionally against a baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            help="Write the report as JSON to this file, for use as a later baseline.",
+        )
+        parser.add_argument(
+            "--baseline",
+            help="JSON report from an earlier build to compare against.",
+        )
+        parser.add_argument(
+            "--budget-kb",
+            type=float,
+            help="Fail when the total transfer size exceeds this many KB.",
+        )
+
+    def handle(self, *args, **options):
+        manifest = staticfiles_storage.load_manifest()
+        if len(manifest) == 0:
+            raise CommandError("No staticfiles manifest found; run collectstatic first.")
+
+        report = {}
+        for name in sorted(manifest):
+            sizes = get_file_sizes(manifest[name])
+            sizes["hashed_name"] = manifest[name]
+            report[name] = sizes
+
+        baseline = {}
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        totals = {"raw": 0, "transfer": 0}
+        baseline_total = 0
+        self.stdout.write("%-48s %10s %10s %10s %10s %10s" % ("file", "raw", "br", "gzip", "transfer", "change"))
+        for name in sorted(report, key=lambda key: -report[key]["transfer"]):
+            sizes = report[name]
+            totals["raw"] += sizes["raw"]
+            totals["transfer"] += sizes["transfer"]
+
+            change = ""
+            if name in baseline:
+                baseline_total += baseline[name]["transfer"]
+                change = "%+d" % (sizes["transfer"] - baseline[name]["transfer"])
+            elif len(baseline) > 0:
+                change = "new"
+            self.stdout.write(
+                "%-48s %10d %10s %10s %10d %10s"
+                % (name, sizes["raw"], sizes.get("br", "-"), sizes.get("gzip", "-"), sizes["transfer"], change)
+            )
+
+        total_change = ""
+        if len(baseline) > 0:
+            for name in baseline:
+                if name not in report:
+                    self.stdout.write("%-48s %10s" % (name, "removed"))
+            total_change = "%+d" % (totals["transfer"] - baseline_total)
+        self.stdout.write(
+            "%-48s %10d %10s %10s %10d %10s"
+            % ("total", totals["raw"], "", "", totals["transfer"], total_change)
+        )
+
+        if options["output"]:
+            with open(options["output"], "w") as output_file:
+                json.dump(report, output_file, indent=2, sort_keys=True)
+
+        if options["budget_kb"] is not None and totals["transfer"] > options["budget_kb"] * 1024:
+            raise CommandError(
+                "Static transfer size %.1f KB is over the %.1f KB budget."
+                % (totals["transfer"] / 1024.0, options["budget_kb"])
+            )
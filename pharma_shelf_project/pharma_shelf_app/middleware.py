@@ -0,0 +1,152 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.functional import SimpleLazyObject
+
+from . import db_connections, db_router, models, static_assets
+
+
+# These middleware work in both modes. Under ASGI Django hands them an async
+# get_response, and a sync-only middleware there would run the rest of the
+# request on the single thread asgiref keeps for sync code, one request at a
+# time, so the async views would gain no concurrency.
+def uses_async(middleware):
+    if asyncio.iscoroutinefunction(middleware.get_response):
+        # lets Django see the instance as a coroutine function and await it
+        middleware._is_coroutine = asyncio.coroutines._is_coroutine
+        return True
+    return False
+
+
+def get_session_user_id(request):
+    return request.session.get("user_id")
+
+
+class CurrentUserMiddleware:
+    # Attaches request.current_user, a cached UserSnapshot of the logged-in
+    # user. It is loaded lazily, so pages that never read it cost nothing.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = uses_async(self)
+
+    def set_current_user(self, request, user_id):
+        request.current_user = None
+        if user_id is not None:
+            request.current_user = SimpleLazyObject(lambda: models.get_user_snapshot(user_id))
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.acall(request)
+        self.set_current_user(request, get_session_user_id(request))
+        return self.get_response(request)
+
+    async def acall(self, request):
+        # loading the session is a query; run it on the pool the async views
+        # use rather than on the one thread asgiref keeps for sync code
+        user_id = await db_connections.run_in_pool(get_session_user_id, request)
+        self.set_current_user(request, user_id)
+        return await self.get_response(request)
+
+
+class StaticAssetMiddleware:
+    # Serves collected files under STATIC_URL straight from STATIC_ROOT,
+    # before sessions and auth run; see static_assets.py. Off with DEBUG on,
+    # where runserver serves the source files, so edits show up without
+    # another collectstatic.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.DEBUG:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.is_async = uses_async(self)
+        self.prefix = "/" + settings.STATIC_URL.strip("/") + "/"
+        self.hashed_names = static_assets.get_hashed_names()
+
+    def get_relative_path(self, request):
+        if request.method in ("GET", "HEAD") and request.path_info.startswith(self.prefix):
+            return request.path_info[len(self.prefix):]
+        return None
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.acall(request)
+        relative_path = self.get_relative_path(request)
+        if relative_path is not None:
+            response = static_assets.serve(request, relative_path, self.hashed_names)
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def acall(self, request):
+        relative_path = self.get_relative_path(request)
+        if relative_path is not None:
+            # file system calls only, so any thread will do
+            serve = sync_to_async(static_assets.serve, thread_sensitive=False)
+            response = await serve(request, relative_path, self.hashed_names)
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+
+class ReplicaReadMiddleware:
+    # Lets the reads of GET and HEAD requests go to the replicas unless this
+    # client wrote recently, and marks clients whose request wrote; see
+    # db_router.py.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if len(settings.DATABASE_REPLICAS) == 0:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.is_async = uses_async(self)
+
+    def primary_pinned(self, request):
+        try:
+            return float(request.COOKIES.get(db_router.PRIMARY_COOKIE, "0")) > time.time()
+        except ValueError:
+            return False
+
+    def get_request_state(self, request):
+        use_primary = request.method not in ("GET", "HEAD") or self.primary_pinned(request)
+        return {"use_primary": use_primary, "wrote": False}
+
+    def mark_writer(self, state, response):
+        # the session is saved on the way out, inside this middleware, so
+        # logging in counts as a write too
+        if state["wrote"]:
+            lag = settings.DB_REPLICA_LAG_SECONDS
+            response.set_cookie(
+                db_router.PRIMARY_COOKIE, str(time.time() + lag), max_age=lag, httponly=True, samesite="Lax"
+            )
+        return response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.acall(request)
+        state = self.get_request_state(request)
+        token = db_router.request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            db_router.request_state.reset(token)
+        return self.mark_writer(state, response)
+
+    async def acall(self, request):
+        # sync_to_async copies the context, so the ORM calls of the async
+        # views and of the sync code below see this request's state
+        state = self.get_request_state(request)
+        token = db_router.request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            db_router.request_state.reset(token)
+        return self.mark_writer(state, response)
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.25 on 2026-10-17 22:33
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+import django.db.models.deletion
+
+
+def populate_counters(apps, schema_editor):
+    Category = apps.get_model('pharma_shelf_app', 'Category')
+    Drug = apps.get_model('pharma_shelf_app', 'Drug')
+    DrugInteraction = apps.get_model('pharma_shelf_app', 'DrugInteraction')
+    InventoryCounter = apps.get_model('pharma_shelf_app', 'InventoryCounter')
+    CategoryDrugCounter = apps.get_model('pharma_shelf_app', 'CategoryDrugCounter')
+
+    drug_totals = Drug.objects.aggregate(
+        drugs=Count('id'),
+        drugs_in_stock=Count('id', filter=Q(stock_quantity__gt=0)),
+        drugs_out_of_stock=Count('id', filter=Q(stock_quantity__lte=0)),
+    )
+    drug_totals['interactions'] = DrugInteraction.objects.count()
+    for name in drug_totals:
+        InventoryCounter.objects.create(name=name, value=drug_totals[name])
+
+    for category in Category.objects.annotate(drug_count=Count('drugs')):
+        CategoryDrugCounter.objects.create(category=category, drug_count=category.drug_count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharma_shelf_app', '0003_alter_user_role'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CategoryDrugCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('drug_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='drug_counter', to='pharma_shelf_app.category')),
+            ],
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def add_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute(
+        'CREATE FULLTEXT INDEX pharma_drug_fulltext '
+        'ON pharma_shelf_app_drug (name, active_ingredient, indications)'
+    )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute('DROP INDEX pharma_drug_fulltext ON pharma_shelf_app_drug')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharma_shelf_app', '0004_inventory_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_fulltext_index, drop_fulltext_index),
+    ]
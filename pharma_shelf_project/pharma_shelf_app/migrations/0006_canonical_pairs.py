@@ -0,0 +1,119 @@
+# Generated by Django 3.2.25 on 2026-10-17 22:36
+
+from django.db import migrations, models
+import django.db.models.expressions
+
+
+# frozen copy of models.SEVERITY_RANKS; lower is more severe
+SEVERITY_RANKS = {
+    'contraindicated': 0,
+    'severe': 1,
+    'major': 1,
+    'high': 1,
+    'moderate': 2,
+    'medium': 2,
+    'minor': 3,
+    'low': 3,
+}
+
+DESCRIPTION_MAX_LENGTH = 255
+
+
+def get_severity_rank(severity):
+    return SEVERITY_RANKS.get(severity.strip().lower(), len(SEVERITY_RANKS))
+
+
+def describe_interaction(interaction):
+    return 'interaction %d (drugs %d and %d, %s): %r' % (
+        interaction.id,
+        interaction.drug_a_id,
+        interaction.drug_b_id,
+        interaction.severity,
+        interaction.description,
+    )
+
+
+def merge_descriptions(kept, removed):
+    # the kept row notes what the removed rows said, as far as it fits; the
+    # migration output lists every removed row in full
+    description = kept.description
+    for interaction in removed:
+        if len(interaction.description) == 0 or interaction.description in description:
+            continue
+        note = 'Also recorded as ' + interaction.severity + ': ' + interaction.description
+        if len(description) > 0:
+            note = ' | ' + note
+        if len(description) + len(note) <= DESCRIPTION_MAX_LENGTH:
+            description += note
+    return description
+
+
+def normalize_pairs(apps, schema_editor):
+    DrugInteraction = apps.get_model('pharma_shelf_app', 'DrugInteraction')
+    DrugAlternative = apps.get_model('pharma_shelf_app', 'DrugAlternative')
+    InventoryCounter = apps.get_model('pharma_shelf_app', 'InventoryCounter')
+
+    # Store each pair once as drug_a_id < drug_b_id. Of duplicate rows the
+    # most severe one is kept (the newest among equally severe ones), so a
+    # later "Major" row is never dropped for an older "Minor" one.
+    pairs = {}
+    removed = []
+    for interaction in DrugInteraction.objects.order_by('id'):
+        if interaction.drug_a_id == interaction.drug_b_id:
+            removed.append(interaction)
+            continue
+        pair = (min(interaction.drug_a_id, interaction.drug_b_id), max(interaction.drug_a_id, interaction.drug_b_id))
+        pairs.setdefault(pair, []).append(interaction)
+
+    for (drug_a_id, drug_b_id), interactions in pairs.items():
+        interactions.sort(key=lambda x: (get_severity_rank(x.severity), -x.created_at.timestamp(), -x.id))
+        kept = interactions[0]
+        duplicates = interactions[1:]
+        removed += duplicates
+
+        description = merge_descriptions(kept, duplicates)
+        if kept.drug_a_id != drug_a_id or description != kept.description:
+            DrugInteraction.objects.filter(id=kept.id).update(
+                drug_a_id=drug_a_id, drug_b_id=drug_b_id, description=description
+            )
+
+    if len(removed) > 0:
+        print('\n  Removed %d duplicate or self-referencing drug interactions:' % len(removed))
+        for interaction in removed:
+            print('    ' + describe_interaction(interaction))
+    DrugInteraction.objects.filter(id__in=[interaction.id for interaction in removed]).delete()
+    InventoryCounter.objects.filter(name='interactions').update(value=DrugInteraction.objects.count())
+
+    # alternatives are directional, so only exact duplicates are removed
+    seen = set()
+    duplicate_ids = []
+    for alternative in DrugAlternative.objects.order_by('id'):
+        pair = (alternative.drug_id, alternative.alternative_drug_id)
+        if pair in seen:
+            duplicate_ids.append(alternative.id)
+            continue
+        seen.add(pair)
+    DrugAlternative.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharma_shelf_app', '0005_drug_fulltext_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_pairs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='drugalternative',
+            constraint=models.UniqueConstraint(fields=('drug', 'alternative_drug'), name='unique_drug_alternative'),
+        ),
+        migrations.AddConstraint(
+            model_name='druginteraction',
+            constraint=models.UniqueConstraint(fields=('drug_a', 'drug_b'), name='unique_drug_interaction_pair'),
+        ),
+        migrations.AddConstraint(
+            model_name='druginteraction',
+            constraint=models.CheckConstraint(check=models.Q(('drug_a__lt', django.db.models.expressions.F('drug_b'))), name='drug_interaction_canonical_order'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 22:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharma_shelf_app', '0006_canonical_pairs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='drug',
+            name='name',
+            field=models.CharField(db_index=True, max_length=150),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-17 22:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharma_shelf_app', '0008_notificationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('change', models.IntegerField()),
+                ('reason', models.CharField(max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('drug', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='pharma_shelf_app.drug')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DrugForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('daily_consumption', models.FloatField(default=0)),
+                ('days_of_supply', models.FloatField(blank=True, null=True)),
+                ('reorder_quantity', models.IntegerField(default=0)),
+                ('computed_at', models.DateTimeField()),
+                ('drug', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='forecast', to='pharma_shelf_app.drug')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 23:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharma_shelf_app', '0009_stock_movements_forecasts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drug',
+            name='import_batch',
+            field=models.CharField(blank=True, db_index=True, max_length=32, null=True),
+        ),
+    ]
@@ -1,6 +1,18 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+import base64
+import hashlib
+import json
 import re
-import bcrypt
+from . import caching, fragments, passwords, search
+from .alternatives_graph import DEFAULT_MAX_DEPTH, alternatives_graph
+from .interaction_graph import canonical_pair, interaction_graph
+
+
+# largest value an IntegerField column holds on MySQL
+MAX_STOCK_QUANTITY = 2147483647
 
 
 
@@ -58,10 +70,16 @@ class DrugManager(models.Manager):
         errors = {}
         if len(postData["name"]) == 0:
             errors["name"] = "Drug name is required."
+        elif len(postData["name"]) > 150:
+            errors["name"] = "Drug name should be at most 150 characters long."
         if len(postData["active_ingredient"]) == 0:
             errors["active_ingredient"] = "Active ingredient is required."
+        elif len(postData["active_ingredient"]) > 150:
+            errors["active_ingredient"] = "Active ingredient should be at most 150 characters long."
         if len(postData["dosage_form"]) == 0:
             errors["dosage_form"] = "Dosage form is required."
+        elif len(postData["dosage_form"]) > 150:
+            errors["dosage_form"] = "Dosage form should be at most 150 characters long."
         if len(postData["indications"]) < 10:
             errors["indications"] = "Indications should be at least 10 characters long."
         if len(postData["side_effects"]) > 0 and len(postData["side_effects"]) < 5:
@@ -71,6 +89,8 @@ class DrugManager(models.Manager):
                 qty = int(postData["stock_quantity"])
                 if qty < 0:
                     errors["stock_quantity"] = "Stock quantity cannot be negative."
+                elif qty > MAX_STOCK_QUANTITY:
+                    errors["stock_quantity"] = "Stock quantity is too large."
             except ValueError:
                 errors["stock_quantity"] = "Stock quantity must be a number."
         return errors
@@ -84,10 +104,27 @@ class DrugManager(models.Manager):
                 qty = int(postData["stock_quantity"])
                 if qty < 0:
                     errors["stock_quantity"] = "Stock quantity cannot be negative."
+                elif qty > MAX_STOCK_QUANTITY:
+                    errors["stock_quantity"] = "Stock quantity is too large."
             except ValueError:
                 errors["stock_quantity"] = "Stock quantity must be a number."
         return errors
 
+    def validate_stock_movement(self, postData):
+        errors = {}
+        if len(postData["quantity"]) == 0:
+            errors["quantity"] = "Quantity is required."
+        else:
+            try:
+                qty = int(postData["quantity"])
+                if qty <= 0:
+                    errors["quantity"] = "Quantity must be greater than zero."
+                elif qty > MAX_STOCK_QUANTITY:
+                    errors["quantity"] = "Quantity is too large."
+            except ValueError:
+                errors["quantity"] = "Quantity must be a number."
+        return errors
+
 
 class CategoryManager(models.Manager):
     def validate_category(self, postData):
@@ -95,9 +132,13 @@ class CategoryManager(models.Manager):
 
         if len(postData["name"]) == 0:
             errors["name"] = "Category name is required."
+        elif len(postData["name"]) > 100:
+            errors["name"] = "Category name should be at most 100 characters long."
 
         if len(postData["description"]) > 0 and len(postData["description"]) < 3:
             errors["description"] = "Description should be at least 3 characters long if provided."
+        elif len(postData["description"]) > 255:
+            errors["description"] = "Description should be at most 255 characters long."
 
         return errors
 
@@ -115,6 +156,10 @@ class DrugInteractionManager(models.Manager):
         if len(postData["drug_a_id"]) > 0 and len(postData["drug_b_id"]) > 0:
             if postData["drug_a_id"] == postData["drug_b_id"]:
                 errors["drug_b_id"] = "Select two different drugs for an interaction."
+            else:
+                drug_a_id, drug_b_id = canonical_pair(int(postData["drug_a_id"]), int(postData["drug_b_id"]))
+                if DrugInteraction.objects.filter(drug_a_id=drug_a_id, drug_b_id=drug_b_id).exists():
+                    errors["drug_b_id"] = "An interaction between these drugs is already recorded."
 
         if len(postData["severity"]) == 0:
             errors["severity"] = "Severity is required."
@@ -137,6 +182,11 @@ class DrugAlternativeManager(models.Manager):
         if len(postData["drug_id"]) > 0 and len(postData["alternative_drug_id"]) > 0:
             if postData["drug_id"] == postData["alternative_drug_id"]:
                 errors["alternative_drug_id"] = "Alternative must be a different drug."
+            elif DrugAlternative.objects.filter(
+                drug_id=postData["drug_id"],
+                alternative_drug_id=postData["alternative_drug_id"]
+            ).exists():
+                errors["alternative_drug_id"] = "This alternative is already recorded for the drug."
 
         if len(postData["note"]) > 0 and len(postData["note"]) < 3:
             errors["note"] = "Note should be at least 3 characters long if provided."
@@ -166,7 +216,7 @@ class Category(models.Model):
 
 
 class Drug(models.Model):
-    name = models.CharField(max_length=150)
+    name = models.CharField(max_length=150, db_index=True)
     active_ingredient = models.CharField(max_length=150)
     dosage_form = models.CharField(max_length=150)
     indications = models.TextField()
@@ -176,6 +226,8 @@ class Drug(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, related_name="drugs_created", on_delete=models.CASCADE)
     category = models.ForeignKey(Category, related_name="drugs", on_delete=models.CASCADE)
+    # set by catalog imports, one value per batch; see catalog_import.py
+    import_batch = models.CharField(max_length=32, null=True, blank=True, db_index=True)
 
     objects = DrugManager()
 
@@ -188,6 +240,11 @@ class DrugAlternative(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     objects = DrugAlternativeManager()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["drug", "alternative_drug"], name="unique_drug_alternative"),
+        ]
+
 
 class DrugInteraction(models.Model):
     drug_a = models.ForeignKey(Drug, related_name="interactions_as_a", on_delete=models.CASCADE)
@@ -198,6 +255,83 @@ class DrugInteraction(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     objects = DrugInteractionManager()
 
+    class Meta:
+        # pairs are stored with drug_a_id < drug_b_id, so each pair has one row
+        constraints = [
+            models.UniqueConstraint(fields=["drug_a", "drug_b"], name="unique_drug_interaction_pair"),
+            models.CheckConstraint(check=Q(drug_a__lt=F("drug_b")), name="drug_interaction_canonical_order"),
+        ]
+
+
+class InventoryCounter(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    value = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class CategoryDrugCounter(models.Model):
+    category = models.OneToOneField(Category, related_name="drug_counter", on_delete=models.CASCADE)
+    drug_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class NotificationJob(models.Model):
+    kind = models.CharField(max_length=50)
+    drug = models.ForeignKey(Drug, related_name="notification_jobs", on_delete=models.CASCADE)
+    app_url = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, default="pending", db_index=True)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(auto_now_add=True)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class StockMovement(models.Model):
+    drug = models.ForeignKey(Drug, related_name="stock_movements", on_delete=models.CASCADE)
+    change = models.IntegerField()
+    reason = models.CharField(max_length=50)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class DrugForecast(models.Model):
+    drug = models.OneToOneField(Drug, related_name="forecast", on_delete=models.CASCADE)
+    daily_consumption = models.FloatField(default=0)
+    days_of_supply = models.FloatField(null=True, blank=True)
+    reorder_quantity = models.IntegerField(default=0)
+    computed_at = models.DateTimeField()
+
+
+INVENTORY_COUNTER_NAMES = ["drugs", "drugs_in_stock", "drugs_out_of_stock", "interactions"]
+
+
+def bump_inventory_counter(name, delta):
+    if delta == 0:
+        return
+    updated = InventoryCounter.objects.filter(name=name).update(value=F("value") + delta)
+    if updated == 0:
+        InventoryCounter.objects.get_or_create(name=name)
+        InventoryCounter.objects.filter(name=name).update(value=F("value") + delta)
+
+
+def bump_category_counter(category_id, delta):
+    if delta == 0:
+        return
+    updated = CategoryDrugCounter.objects.filter(category_id=category_id).update(drug_count=F("drug_count") + delta)
+    if updated == 0:
+        CategoryDrugCounter.objects.get_or_create(category_id=category_id)
+        CategoryDrugCounter.objects.filter(category_id=category_id).update(drug_count=F("drug_count") + delta)
+
+
+def bump_stock_counters(old_quantity, new_quantity):
+    # old_quantity is None for a drug that did not exist before
+    was_in_stock = old_quantity is not None and old_quantity > 0
+    was_out_of_stock = old_quantity is not None and old_quantity <= 0
+    is_in_stock = new_quantity > 0
+    bump_inventory_counter("drugs_in_stock", int(is_in_stock) - int(was_in_stock))
+    bump_inventory_counter("drugs_out_of_stock", int(not is_in_stock) - int(was_out_of_stock))
+
 
 def create_user(postData, pw_hash):
     user = User.objects.create(
@@ -219,6 +353,46 @@ def get_current_user(id):
     return user
 
 
+USER_SNAPSHOT_TIMEOUT = 300
+
+
+class UserSnapshot:
+    # The handful of User fields the views and templates read on every
+    # request, cached so authenticated pages need no User query.
+    def __init__(self, data):
+        self.id = data["id"]
+        self.name = data["name"]
+        self.email = data["email"]
+        self.role = data["role"]
+        self.is_active = data["is_active"]
+
+
+def user_namespace(user_id):
+    return "user_snapshot:" + str(user_id)
+
+
+def load_user_snapshot_data(user_id):
+    user = User.objects.get(id=user_id)
+    return {
+        "id": user.id,
+        "name": user.name,
+        "email": user.email,
+        "role": user.role,
+        "is_active": user.is_active,
+    }
+
+
+def get_user_snapshot(user_id):
+    data = caching.get_or_compute(
+        user_namespace(user_id), "data", lambda: load_user_snapshot_data(user_id), USER_SNAPSHOT_TIMEOUT
+    )
+    return UserSnapshot(data)
+
+
+def invalidate_user_snapshot(user_id):
+    caching.invalidate(user_namespace(user_id))
+
+
 def get_all_categories():
     all_categories = Category.objects.all()
     return all_categories
@@ -232,16 +406,23 @@ def create_drug(postData, user_id):
     if len(postData["stock_quantity"]) > 0:
         stock_quantity = int(postData["stock_quantity"])
 
-    drug = Drug.objects.create(
-        name=postData["name"],
-        active_ingredient=postData["active_ingredient"],
-        dosage_form=postData["dosage_form"],
-        indications=postData["indications"],
-        side_effects=postData["side_effects"],
-        stock_quantity=stock_quantity,
-        created_by=current_user,
-        category=category
-    )
+    with transaction.atomic():
+        drug = Drug.objects.create(
+            name=postData["name"],
+            active_ingredient=postData["active_ingredient"],
+            dosage_form=postData["dosage_form"],
+            indications=postData["indications"],
+            side_effects=postData["side_effects"],
+            stock_quantity=stock_quantity,
+            created_by=current_user,
+            category=category
+        )
+        bump_inventory_counter("drugs", 1)
+        bump_stock_counters(None, stock_quantity)
+        record_stock_movement(drug.id, stock_quantity, "initial")
+        bump_category_counter(category.id, 1)
+        transaction.on_commit(lambda: search.index_drug(drug))
+        fragments.bump_fragment_version_on_commit("catalog")
     return drug
 
 def get_all_drugs():
@@ -250,11 +431,41 @@ def get_all_drugs():
 
 
 
-def create_category(postData):
-    category = Category.objects.create(
-        name=postData["name"],
-        description=postData["description"]
+def get_drug_suggestions(query, limit):
+    query = query.strip()
+    if len(query) == 0:
+        return []
+
+    # prefix matches come first and can use the index on name
+    suggestions = list(
+        Drug.objects.filter(name__istartswith=query)
+        .order_by("name", "id")
+        .values("id", "name", "dosage_form")[:limit]
     )
+    if len(suggestions) < limit and len(query) >= 3:
+        prefix_ids = [item["id"] for item in suggestions]
+        suggestions += list(
+            Drug.objects.filter(name__icontains=query)
+            .exclude(id__in=prefix_ids)
+            .order_by("name", "id")
+            .values("id", "name", "dosage_form")[:limit - len(suggestions)]
+        )
+    return suggestions
+
+
+def get_drugs_by_ids(drug_ids):
+    drugs = Drug.objects.filter(id__in=drug_ids).only("id", "name", "dosage_form").order_by("name")
+    return drugs
+
+
+def create_category(postData):
+    with transaction.atomic():
+        category = Category.objects.create(
+            name=postData["name"],
+            description=postData["description"]
+        )
+        CategoryDrugCounter.objects.create(category=category)
+        fragments.bump_fragment_version_on_commit("categories")
     return category
 
 def get_drug_by_id(drug_id):
@@ -263,30 +474,120 @@ def get_drug_by_id(drug_id):
 
 
 def create_interaction(postData):
-    drug_a = Drug.objects.get(id=postData["drug_a_id"])
-    drug_b = Drug.objects.get(id=postData["drug_b_id"])
-
-    interaction = DrugInteraction.objects.create(
-        drug_a=drug_a,
-        drug_b=drug_b,
-        severity=postData["severity"],
-        description=postData["description"]
-    )
+    drug_a_id, drug_b_id = canonical_pair(int(postData["drug_a_id"]), int(postData["drug_b_id"]))
+    drug_a = Drug.objects.get(id=drug_a_id)
+    drug_b = Drug.objects.get(id=drug_b_id)
+
+    with transaction.atomic():
+        interaction = DrugInteraction.objects.create(
+            drug_a=drug_a,
+            drug_b=drug_b,
+            severity=postData["severity"],
+            description=postData["description"]
+        )
+        bump_inventory_counter("interactions", 1)
+        transaction.on_commit(lambda: interaction_graph.add_interaction(interaction))
+        fragments.bump_fragment_version_on_commit("catalog")
     return interaction
 
 
 def get_interactions_between(drug_a_id, drug_b_id):
-    interactions = DrugInteraction.objects.filter(drug_a_id=drug_a_id, drug_b_id=drug_b_id)
-    if len(interactions) == 0:
-        interactions = DrugInteraction.objects.filter(drug_a_id=drug_b_id, drug_b_id=drug_a_id)
+    return get_interactions_for_regimen([drug_a_id, drug_b_id])
+
+
+SEVERITY_RANKS = {
+    "contraindicated": 0,
+    "severe": 1,
+    "major": 1,
+    "high": 1,
+    "moderate": 2,
+    "medium": 2,
+    "minor": 3,
+    "low": 3,
+}
+
+
+def get_severity_rank(severity):
+    return SEVERITY_RANKS.get(severity.strip().lower(), len(SEVERITY_RANKS))
+
+
+def get_interactions_for_regimen(drug_ids):
+    # Answered from the process-local interaction graph, which loads every
+    # DrugInteraction once and reloads only after the shared version changes.
+    drug_ids = list(set(drug_ids))
+    if len(drug_ids) < 2:
+        return []
+
+    interactions = interaction_graph.get_interactions(drug_ids)
+
+    interactions = sorted(
+        interactions,
+        key=lambda x: (get_severity_rank(x.severity), x.drug_a.name, x.drug_b.name)
+    )
     return interactions
 
 
+def get_drug_details_stamp(drug_id):
+    # Everything the drug details page shows about the drug and its direct
+    # alternatives changes one of these values; one query, no rows loaded.
+    stamps = Drug.objects.filter(id=drug_id).annotate(
+        alternative_count=Count("alternatives"),
+        alternatives_updated_at=Max("alternatives__updated_at"),
+        alternative_drugs_updated_at=Max("alternatives__alternative_drug__updated_at"),
+    ).values(
+        "updated_at",
+        "stock_quantity",
+        "alternative_count",
+        "alternatives_updated_at",
+        "alternative_drugs_updated_at",
+    )
+    for stamp in stamps:
+        return stamp
+    return None
+
+
 def get_alternatives_for_drug(drug_id):
-    alternatives = DrugAlternative.objects.filter(drug_id=drug_id)
+    alternatives = DrugAlternative.objects.filter(drug_id=drug_id).select_related("alternative_drug__category")
     return alternatives
 
 
+def get_in_stock_substitutes(drug_id, max_depth=DEFAULT_MAX_DEPTH):
+    # Alternatives-of-alternatives come from the in-memory graph; only the
+    # stock check goes to the database, in one query for all candidates.
+    reachable = alternatives_graph.reachable(drug_id, max_depth)
+    if len(reachable) == 0:
+        return []
+
+    via_ids = []
+    for item in reachable.values():
+        if item["via_id"] is not None:
+            via_ids.append(item["via_id"])
+
+    candidates = Drug.objects.filter(
+        Q(id__in=list(reachable.keys()), stock_quantity__gt=0) | Q(id__in=via_ids)
+    ).select_related("category")
+    drugs = {}
+    for drug in candidates:
+        drugs[drug.id] = drug
+
+    substitutes = []
+    for alternative_id, item in reachable.items():
+        drug = drugs.get(alternative_id)
+        if drug is None or drug.stock_quantity <= 0:
+            continue
+        substitutes.append(
+            {
+                "drug": drug,
+                "depth": item["depth"],
+                "via": drugs.get(item["via_id"]),
+                "note": item["note"],
+            }
+        )
+
+    substitutes.sort(key=lambda x: (x["depth"], -x["drug"].stock_quantity, x["drug"].name))
+    return substitutes
+
+
 def create_alternative(postData):
     drug = Drug.objects.get(id=postData["drug_id"])
     alternative_drug = Drug.objects.get(id=postData["alternative_drug_id"])
@@ -296,21 +597,170 @@ def create_alternative(postData):
         alternative_drug=alternative_drug,
         note=postData["note"]
     )
+    transaction.on_commit(alternatives_graph.invalidate)
+    fragments.bump_fragment_version_on_commit("catalog")
     return alternative
 
 
 def delete_alternative_by_id(alt_id):
     alternative = DrugAlternative.objects.get(id=alt_id)
     alternative.delete()
+    transaction.on_commit(alternatives_graph.invalidate)
+    fragments.bump_fragment_version_on_commit("catalog")
 
 
 def update_drug_stock(drug_id, new_stock):
-    drug = Drug.objects.get(id=drug_id)
-    drug.stock_quantity = new_stock
-    drug.save()
+    with transaction.atomic():
+        drug = Drug.objects.select_for_update().get(id=drug_id)
+        old_stock = drug.stock_quantity
+        drug.stock_quantity = new_stock
+        drug.save()
+        bump_stock_counters(old_stock, new_stock)
+        record_stock_movement(drug.id, new_stock - old_stock, "adjustment")
+        fragments.bump_fragment_version_on_commit("catalog")
     return drug
 
 
+def enqueue_out_of_stock_notification(drug, app_url):
+    job = NotificationJob.objects.create(
+        kind="out_of_stock",
+        drug=drug,
+        app_url=app_url
+    )
+    return job
+
+
+def record_stock_movement(drug_id, change, reason):
+    if change == 0:
+        return None
+    movement = StockMovement.objects.create(drug_id=drug_id, change=change, reason=reason)
+    return movement
+
+
+def get_reorder_suggestions(limit=10):
+    forecasts = DrugForecast.objects.filter(reorder_quantity__gt=0).select_related("drug").order_by(
+        F("days_of_supply").asc(nulls_last=True), "drug__name"
+    )[:limit]
+    return forecasts
+
+
+def dispense_drug_stock(drug_id, quantity):
+    # Conditional UPDATEs instead of read-modify-write: the database checks
+    # the stock level and applies the decrement atomically, so concurrent
+    # dispenses can neither overwrite each other nor go below zero.
+    # Returns "dispensed", "out_of_stock" (dispensed down to zero),
+    # "insufficient" or "not_found".
+    with transaction.atomic():
+        now = timezone.now()
+        updated = Drug.objects.filter(id=drug_id, stock_quantity__gt=quantity).update(
+            stock_quantity=F("stock_quantity") - quantity,
+            updated_at=now
+        )
+        if updated == 1:
+            record_stock_movement(drug_id, -quantity, "dispense")
+            fragments.bump_fragment_version_on_commit("catalog")
+            return "dispensed"
+
+        updated = Drug.objects.filter(id=drug_id, stock_quantity=quantity).update(
+            stock_quantity=0,
+            updated_at=now
+        )
+        if updated == 1:
+            bump_stock_counters(quantity, 0)
+            record_stock_movement(drug_id, -quantity, "dispense")
+            fragments.bump_fragment_version_on_commit("catalog")
+            return "out_of_stock"
+    if not Drug.objects.filter(id=drug_id).exists():
+        return "not_found"
+    return "insufficient"
+
+
+def receive_drug_stock(drug_id, quantity):
+    # Returns "received", "too_large" (the new stock would not fit the
+    # column) or "not_found".
+    with transaction.atomic():
+        now = timezone.now()
+        room = Q(stock_quantity__lte=MAX_STOCK_QUANTITY - quantity)
+        updated = Drug.objects.filter(room, id=drug_id, stock_quantity__gt=0).update(
+            stock_quantity=F("stock_quantity") + quantity,
+            updated_at=now
+        )
+        if updated == 1:
+            record_stock_movement(drug_id, quantity, "receive")
+            fragments.bump_fragment_version_on_commit("catalog")
+            return "received"
+
+        updated = Drug.objects.filter(room, id=drug_id, stock_quantity__lte=0).update(
+            stock_quantity=F("stock_quantity") + quantity,
+            updated_at=now
+        )
+        if updated == 1:
+            bump_stock_counters(0, quantity)
+            record_stock_movement(drug_id, quantity, "receive")
+            fragments.bump_fragment_version_on_commit("catalog")
+            return "received"
+    if not Drug.objects.filter(id=drug_id).exists():
+        return "not_found"
+    return "too_large"
+
+
+def bulk_update_drug_stock(entries):
+    # entries is a list of (drug_id, quantity) pairs; when a drug appears more
+    # than once, the last quantity wins
+    errors = {}
+    new_stock = {}
+    for drug_id, quantity in entries:
+        stock_errors = Drug.objects.validate_stock_update({"stock_quantity": str(quantity)})
+        if len(stock_errors) > 0:
+            errors[drug_id] = stock_errors["stock_quantity"]
+            continue
+        new_stock[drug_id] = int(quantity)
+
+    if len(errors) > 0 or len(new_stock) == 0:
+        return errors, []
+
+    with transaction.atomic():
+        drugs = list(
+            Drug.objects.select_for_update()
+            .filter(id__in=list(new_stock.keys()))
+            .only("id", "name", "stock_quantity", "updated_at")
+        )
+        found_ids = set([drug.id for drug in drugs])
+        for drug_id in new_stock:
+            if drug_id not in found_ids:
+                errors[drug_id] = "Drug does not exist."
+        if len(errors) > 0:
+            return errors, []
+
+        now = timezone.now()
+        in_stock_delta = 0
+        out_of_stock = []
+        movements = []
+        for drug in drugs:
+            old_quantity = drug.stock_quantity
+            drug.stock_quantity = new_stock[drug.id]
+            drug.updated_at = now
+            in_stock_delta += int(drug.stock_quantity > 0) - int(old_quantity > 0)
+            if drug.stock_quantity == 0 and old_quantity != 0:
+                out_of_stock.append(drug)
+            if drug.stock_quantity != old_quantity:
+                movements.append(StockMovement(drug_id=drug.id, change=drug.stock_quantity - old_quantity, reason="bulk_update"))
+
+        Drug.objects.bulk_update(drugs, ["stock_quantity", "updated_at"], batch_size=500)
+        StockMovement.objects.bulk_create(movements, batch_size=500)
+        bump_inventory_counter("drugs_in_stock", in_stock_delta)
+        bump_inventory_counter("drugs_out_of_stock", -in_stock_delta)
+        fragments.bump_fragment_version_on_commit("catalog")
+    return errors, out_of_stock
+
+
+def enqueue_out_of_stock_notifications(drugs, app_url):
+    jobs = []
+    for drug in drugs:
+        jobs.append(NotificationJob(kind="out_of_stock", drug=drug, app_url=app_url))
+    return NotificationJob.objects.bulk_create(jobs)
+
+
 def get_admin_emails():
     admins = User.objects.filter(role="admin")
     emails = []
@@ -321,21 +771,37 @@ def get_admin_emails():
 
 
 def update_drug_details(drug_id, postData):
-    drug = Drug.objects.get(id=drug_id)
     category = Category.objects.get(id=postData["category_id"])
 
     stock_quantity = 0
     if len(postData["stock_quantity"]) > 0:
         stock_quantity = int(postData["stock_quantity"])
 
-    drug.name = postData["name"]
-    drug.active_ingredient = postData["active_ingredient"]
-    drug.dosage_form = postData["dosage_form"]
-    drug.indications = postData["indications"]
-    drug.side_effects = postData["side_effects"]
-    drug.stock_quantity = stock_quantity
-    drug.category = category
-    drug.save()
+    with transaction.atomic():
+        drug = Drug.objects.select_for_update().get(id=drug_id)
+        old_stock = drug.stock_quantity
+        old_category_id = drug.category_id
+        old_name = drug.name
+
+        drug.name = postData["name"]
+        drug.active_ingredient = postData["active_ingredient"]
+        drug.dosage_form = postData["dosage_form"]
+        drug.indications = postData["indications"]
+        drug.side_effects = postData["side_effects"]
+        drug.stock_quantity = stock_quantity
+        drug.category = category
+        drug.save()
+
+        bump_stock_counters(old_stock, stock_quantity)
+        record_stock_movement(drug.id, stock_quantity - old_stock, "edit")
+        if old_category_id != category.id:
+            bump_category_counter(old_category_id, -1)
+            bump_category_counter(category.id, 1)
+        transaction.on_commit(lambda: search.index_drug(drug))
+        fragments.bump_fragment_version_on_commit("catalog")
+        if old_name != drug.name:
+            # cached interactions carry the drug names shown by the checker
+            transaction.on_commit(interaction_graph.invalidate)
     return drug
 
 
@@ -352,6 +818,7 @@ def update_user_from_admin(user_id, postData):
         is_active = True
     user.is_active = is_active
     user.save()
+    transaction.on_commit(lambda: invalidate_user_snapshot(user.id))
     return user
 
 
@@ -359,28 +826,266 @@ def update_user_name(user_id, postData):
     user = User.objects.get(id=user_id)
     user.name = postData["name"]
     user.save()
+    transaction.on_commit(lambda: invalidate_user_snapshot(user.id))
     return user
 
 
 def update_user_password(user_id, new_password):
+    pw_hash = passwords.hash_password(new_password)
+    return set_user_password_hash(user_id, pw_hash)
+
+
+def set_user_password_hash(user_id, pw_hash):
     user = User.objects.get(id=user_id)
-    pw_hash = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt()).decode()
     user.password_hash = pw_hash
     user.save()
+    transaction.on_commit(lambda: invalidate_user_snapshot(user.id))
     return user
 
 
 def get_filtered_drugs(search_query, selected_category_id, in_stock_only):
     qs = Drug.objects.all()
 
-    if search_query is not None and len(search_query) > 0:
-        qs = qs.filter(name__icontains=search_query)
-
     if selected_category_id > 0:
         qs = qs.filter(category_id=selected_category_id)
 
     if in_stock_only:
         qs = qs.filter(stock_quantity__gt=0)
 
-    qs = qs.order_by("name")
+    if search_query is not None and len(search_query.strip()) > 0:
+        qs = search.search_drugs(qs, search_query)
+        qs = qs.order_by("-relevance", "name", "id")
+    else:
+        qs = qs.order_by("name", "id")
     return qs
+
+
+def encode_drug_cursor(drug, direction):
+    payload = json.dumps({"n": drug.name, "i": drug.id, "d": direction}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_drug_cursor(token):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        if payload["d"] not in ["next", "prev"]:
+            return None
+        return str(payload["n"]), int(payload["i"]), payload["d"]
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def get_drugs_page_by_cursor(qs, cursor, page_size):
+    # Keyset pagination on (name, id): each page is a range scan that starts
+    # right after the last row of the previous page instead of an OFFSET.
+    qs = qs.order_by("name", "id")
+    position = None
+    if cursor is not None and len(cursor) > 0:
+        position = decode_drug_cursor(cursor)
+
+    direction = "next"
+    if position is not None:
+        name, drug_id, direction = position
+        if direction == "next":
+            qs = qs.filter(Q(name__gt=name) | Q(name=name, id__gt=drug_id))
+        else:
+            qs = qs.filter(Q(name__lt=name) | Q(name=name, id__lt=drug_id)).order_by("-name", "-id")
+
+    rows = list(qs[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == "prev":
+        rows.reverse()
+
+    next_cursor = None
+    previous_cursor = None
+    if len(rows) > 0:
+        if direction == "next":
+            if has_more:
+                next_cursor = encode_drug_cursor(rows[-1], "next")
+            if position is not None:
+                previous_cursor = encode_drug_cursor(rows[0], "prev")
+        else:
+            next_cursor = encode_drug_cursor(rows[-1], "next")
+            if has_more:
+                previous_cursor = encode_drug_cursor(rows[0], "prev")
+    return rows, next_cursor, previous_cursor
+
+
+def get_estimated_drug_count(qs, search_query, selected_category_id, in_stock_only, timeout=300):
+    key_source = json.dumps([search_query, selected_category_id, in_stock_only])
+    key = hashlib.md5(key_source.encode()).hexdigest()
+    return caching.get_or_compute("drugs_count", key, qs.count, timeout)
+
+
+EXPORT_FIELDS = [
+    "id",
+    "name",
+    "active_ingredient",
+    "dosage_form",
+    "indications",
+    "side_effects",
+    "stock_quantity",
+    "category__name",
+    "created_by__name",
+    "created_at",
+    "updated_at",
+]
+
+
+def iter_drug_export_rows(qs, chunk_size=2000):
+    # Walks the filtered queryset in id order, one keyset page at a time, so
+    # at most chunk_size rows are held in memory whatever the catalog size
+    # and regardless of whether the database driver buffers whole results.
+    qs = qs.order_by("id")
+    last_id = 0
+    while True:
+        rows = list(qs.filter(id__gt=last_id).values_list(*EXPORT_FIELDS)[:chunk_size])
+        for row in rows:
+            yield row
+        if len(rows) < chunk_size:
+            break
+        last_id = rows[-1][0]
+
+
+def count_inventory():
+    drug_totals = Drug.objects.aggregate(
+        drugs=Count("id"),
+        drugs_in_stock=Count("id", filter=Q(stock_quantity__gt=0)),
+        drugs_out_of_stock=Count("id", filter=Q(stock_quantity__lte=0)),
+    )
+    counts = {
+        "drugs": drug_totals["drugs"],
+        "drugs_in_stock": drug_totals["drugs_in_stock"],
+        "drugs_out_of_stock": drug_totals["drugs_out_of_stock"],
+        "interactions": DrugInteraction.objects.count(),
+    }
+    category_counts = {}
+    for row in Category.objects.annotate(drug_count=Count("drugs")).values("id", "drug_count"):
+        category_counts[row["id"]] = row["drug_count"]
+    return counts, category_counts
+
+
+def get_inventory_counters():
+    counts = {}
+    for name in INVENTORY_COUNTER_NAMES:
+        counts[name] = 0
+    for counter in InventoryCounter.objects.filter(name__in=INVENTORY_COUNTER_NAMES):
+        counts[counter.name] = counter.value
+    category_counts = {}
+    for row in CategoryDrugCounter.objects.values("category_id", "drug_count"):
+        category_counts[row["category_id"]] = row["drug_count"]
+    return counts, category_counts
+
+
+def verify_inventory_counters():
+    expected_counts, expected_category_counts = count_inventory()
+    stored_counts, stored_category_counts = get_inventory_counters()
+
+    mismatches = []
+    for name in INVENTORY_COUNTER_NAMES:
+        if stored_counts[name] != expected_counts[name]:
+            mismatches.append((name, stored_counts[name], expected_counts[name]))
+    for category_id in expected_category_counts:
+        stored = stored_category_counts.get(category_id)
+        if stored != expected_category_counts[category_id]:
+            mismatches.append(("category:" + str(category_id), stored, expected_category_counts[category_id]))
+    return mismatches
+
+
+def rebuild_inventory_counters():
+    with transaction.atomic():
+        counts, category_counts = count_inventory()
+        for name in INVENTORY_COUNTER_NAMES:
+            InventoryCounter.objects.update_or_create(name=name, defaults={"value": counts[name]})
+        CategoryDrugCounter.objects.exclude(category_id__in=list(category_counts.keys())).delete()
+        for category_id in category_counts:
+            CategoryDrugCounter.objects.update_or_create(
+                category_id=category_id,
+                defaults={"drug_count": category_counts[category_id]}
+            )
+        fragments.bump_fragment_version_on_commit("catalog")
+    return counts, category_counts
+
+
+def get_catalog_stats(top_n=5):
+    counters = {}
+    for counter in InventoryCounter.objects.filter(name__in=INVENTORY_COUNTER_NAMES):
+        counters[counter.name] = counter.value
+
+    categories = Category.objects.annotate(
+        drug_count=Coalesce(F("drug_counter__drug_count"), 0)
+    ).order_by("-drug_count", "name")
+    categories_stats = []
+    total_for_percent = 0
+    for category in categories:
+        categories_stats.append(
+            {
+                "category": category,
+                "drug_count": category.drug_count,
+            }
+        )
+        total_for_percent += category.drug_count
+
+    top_categories_stats = []
+    categories_chart_labels = []
+    categories_chart_counts = []
+    for item in categories_stats[:top_n]:
+        percentage = 0
+        if total_for_percent > 0:
+            percentage = round((item["drug_count"] * 100.0) / total_for_percent)
+        top_categories_stats.append(
+            {
+                "category": item["category"],
+                "drug_count": item["drug_count"],
+                "percentage": percentage,
+            }
+        )
+        categories_chart_labels.append(item["category"].name)
+        categories_chart_counts.append(item["drug_count"])
+
+    other_count = 0
+    for item in categories_stats[top_n:]:
+        other_count += item["drug_count"]
+    if other_count > 0:
+        categories_chart_labels.append("Other")
+        categories_chart_counts.append(other_count)
+
+    return {
+        "total_drugs": counters.get("drugs", 0),
+        "in_stock_drugs": counters.get("drugs_in_stock", 0),
+        "out_of_stock_drugs": counters.get("drugs_out_of_stock", 0),
+        "total_categories": len(categories_stats),
+        "total_interactions": counters.get("interactions", 0),
+        "categories_stats": categories_stats,
+        "top_categories_stats": top_categories_stats,
+        "categories_chart_labels": categories_chart_labels,
+        "categories_chart_counts": categories_chart_counts,
+    }
+
+
+def get_user_stats(include_users):
+    user_totals = {
+        "total": 0,
+        "active": 0,
+        "disabled": 0,
+        "admins": 0,
+        "pharmacists": 0,
+    }
+    if include_users:
+        user_totals = User.objects.aggregate(
+            total=Count("id"),
+            active=Count("id", filter=Q(is_active=True)),
+            disabled=Count("id", filter=Q(is_active=False)),
+            admins=Count("id", filter=Q(role="admin")),
+            pharmacists=Count("id", filter=Q(role="pharmacist")),
+        )
+
+    return {
+        "users_total": user_totals["total"],
+        "users_active": user_totals["active"],
+        "users_disabled": user_totals["disabled"],
+        "admins_count": user_totals["admins"],
+        "pharmacists_count": user_totals["pharmacists"],
+    }
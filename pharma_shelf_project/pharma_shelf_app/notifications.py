@@ -0,0 +1,156 @@
+import logging
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from . import models
+
+
+MAX_ATTEMPTS = 5
+
+# seconds before the first retry; doubled after every failed attempt
+BACKOFF_BASE = 30
+
+# messages a StubTransport keeps; older ones are dropped
+STUB_OUTBOX_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+
+class SendGridTransport:
+    def send(self, to_emails, subject, plain_text, html_content):
+        from sendgrid import SendGridAPIClient
+        from sendgrid.helpers.mail import Mail
+
+        sg = SendGridAPIClient(settings.SENDGRID_API_KEY)
+        message = Mail(
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to_emails=to_emails,
+            subject=subject,
+            plain_text_content=plain_text,
+            html_content=html_content,
+        )
+        sg.send(message)
+
+
+class StubTransport:
+    # Keeps the last messages it sent in memory and logs them instead of
+    # calling SendGrid, for development and tests without network access.
+    def __init__(self):
+        self.outbox = deque(maxlen=STUB_OUTBOX_SIZE)
+
+    def send(self, to_emails, subject, plain_text, html_content):
+        self.outbox.append(
+            {
+                "to_emails": list(to_emails),
+                "subject": subject,
+                "plain_text": plain_text,
+                "html_content": html_content,
+            }
+        )
+        logger.info("Notification to %s: %s", ", ".join(to_emails), subject)
+
+
+def get_transport():
+    if settings.NOTIFICATION_TRANSPORT == "sendgrid":
+        return SendGridTransport()
+    return StubTransport()
+
+
+def describe_error(error):
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return "HTTP " + str(status_code) + ": " + str(getattr(error, "body", ""))
+    return repr(error)
+
+
+def claim_due_jobs(now):
+    # Jobs are claimed by pushing next_attempt_at forward inside a locking
+    # transaction, so two workers never send the same batch.
+    with transaction.atomic():
+        jobs = list(
+            models.NotificationJob.objects.select_for_update()
+            .filter(status="pending", next_attempt_at__lte=now)
+            .select_related("drug", "drug__category")
+            .order_by("id")
+        )
+        if len(jobs) > 0:
+            models.NotificationJob.objects.filter(id__in=[job.id for job in jobs]).update(
+                next_attempt_at=now + timedelta(seconds=BACKOFF_BASE)
+            )
+    return jobs
+
+
+def send_out_of_stock_batch(jobs, transport, now):
+    # Several out-of-stock events collected since the last run become a
+    # single message; drugs that were restocked meanwhile are left out.
+    drugs = []
+    app_url = ""
+    for job in jobs:
+        job.drug.refresh_from_db(fields=["stock_quantity"])
+        if job.drug.stock_quantity <= 0 and job.drug not in drugs:
+            drugs.append(job.drug)
+        if len(job.app_url) > 0:
+            app_url = job.app_url
+
+    job_ids = [job.id for job in jobs]
+    if len(drugs) == 0:
+        models.NotificationJob.objects.filter(id__in=job_ids).update(status="cancelled", updated_at=now)
+        return 0
+
+    admin_emails = models.get_admin_emails()
+    if len(admin_emails) == 0:
+        models.NotificationJob.objects.filter(id__in=job_ids).update(status="cancelled", updated_at=now)
+        return 0
+
+    if len(drugs) == 1:
+        subject = "Drug out of stock: " + drugs[0].name
+        plain_text = "The following drug is now out of stock: " + drugs[0].name
+    else:
+        names = ", ".join([drug.name for drug in drugs])
+        subject = str(len(drugs)) + " drugs out of stock"
+        plain_text = "The following drugs are now out of stock: " + names
+    html_content = render_to_string(
+        "emails/out_of_stock.html",
+        {
+            "drugs": drugs,
+            "app_url": app_url
+        }
+    )
+
+    try:
+        transport.send(admin_emails, subject, plain_text, html_content)
+    except Exception as e:
+        record_failure(jobs, describe_error(e), now)
+        return 0
+
+    models.NotificationJob.objects.filter(id__in=job_ids).update(status="sent", sent_at=now, updated_at=now)
+    return 1
+
+
+def record_failure(jobs, error, now):
+    for job in jobs:
+        job.attempts += 1
+        job.last_error = error
+        if job.attempts >= MAX_ATTEMPTS:
+            job.status = "failed"
+        else:
+            job.next_attempt_at = now + timedelta(seconds=BACKOFF_BASE * (2 ** (job.attempts - 1)))
+        job.save(update_fields=["attempts", "last_error", "status", "next_attempt_at", "updated_at"])
+
+
+def process_notifications(transport=None):
+    if transport is None:
+        transport = get_transport()
+    now = timezone.now()
+    jobs = claim_due_jobs(now)
+
+    out_of_stock_jobs = [job for job in jobs if job.kind == "out_of_stock"]
+    sent = 0
+    if len(out_of_stock_jobs) > 0:
+        sent += send_out_of_stock_batch(out_of_stock_jobs, transport, now)
+    return len(jobs), sent
@@ -0,0 +1,41 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from django.conf import settings
+
+
+# bcrypt releases the GIL while hashing, so a small pool runs hashes in
+# parallel without blocking the event loop that serves the other requests.
+# The pool is bounded so a login burst cannot take every core.
+executor = ThreadPoolExecutor(max_workers=settings.BCRYPT_MAX_WORKERS, thread_name_prefix="bcrypt")
+
+
+def hash_password(password):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(settings.BCRYPT_ROUNDS)).decode()
+
+
+def check_password(password, password_hash):
+    return bcrypt.checkpw(password.encode(), password_hash.encode())
+
+
+def get_rounds(password_hash):
+    # "$2b$12$<salt+hash>" -> 12
+    try:
+        return int(password_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def needs_rehash(password_hash):
+    return get_rounds(password_hash) != settings.BCRYPT_ROUNDS
+
+
+async def ahash_password(password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, hash_password, password)
+
+
+async def acheck_password(password, password_hash):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, check_password, password, password_hash)
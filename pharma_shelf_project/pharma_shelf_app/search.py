@@ -0,0 +1,202 @@
+import bisect
+import re
+import threading
+
+from django.db import connection
+from django.db.models import Case, FloatField, Value, When
+from django.db.models.expressions import RawSQL
+
+from .caching import bump_namespace_version, get_namespace_version
+
+
+# Relative weight of a term match in each searchable field.
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "active_ingredient": 2.0,
+    "indications": 1.0,
+}
+
+# Every match is returned, but only this many of the best carry their score
+# into SQL (one CASE branch each); the rest follow them in name order.
+MAX_SCORED_RESULTS = 1000
+
+# InnoDB ignores FULLTEXT terms shorter than innodb_ft_min_token_size.
+FULLTEXT_MIN_TOKEN_SIZE = 3
+
+TOKEN_REGEX = re.compile(r"[a-z0-9]+")
+
+# bumped on every drug write so each worker's index notices and rebuilds
+VERSION_NAMESPACE = "drug_index"
+
+
+def tokenize(text):
+    if text is None:
+        return []
+    return TOKEN_REGEX.findall(text.lower())
+
+
+def use_fulltext():
+    return connection.vendor == "mysql"
+
+
+class InvertedIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        # token -> {drug_id: weight}
+        self.postings = {}
+        # drug_id -> set of tokens, used to drop stale postings on update
+        self.drug_tokens = {}
+        self.sorted_tokens = []
+
+    def _remove(self, drug_id):
+        tokens = self.drug_tokens.pop(drug_id, None)
+        if tokens is None:
+            return
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(drug_id, None)
+            if len(posting) == 0:
+                del self.postings[token]
+                i = bisect.bisect_left(self.sorted_tokens, token)
+                if i < len(self.sorted_tokens) and self.sorted_tokens[i] == token:
+                    del self.sorted_tokens[i]
+
+    def _add(self, drug_id, fields):
+        tokens = set()
+        for field in FIELD_WEIGHTS:
+            for token in tokenize(fields[field]):
+                posting = self.postings.get(token)
+                if posting is None:
+                    posting = {}
+                    self.postings[token] = posting
+                    bisect.insort(self.sorted_tokens, token)
+                posting[drug_id] = posting.get(drug_id, 0.0) + FIELD_WEIGHTS[field]
+                tokens.add(token)
+        self.drug_tokens[drug_id] = tokens
+
+    def _build(self, version):
+        from .models import Drug
+
+        self.postings = {}
+        self.drug_tokens = {}
+        self.sorted_tokens = []
+        rows = Drug.objects.values("id", *FIELD_WEIGHTS.keys()).iterator(chunk_size=2000)
+        for row in rows:
+            self._add(row["id"], row)
+        self.version = version
+
+    def ensure_current(self):
+        version = get_namespace_version(VERSION_NAMESPACE)
+        if version == self.version:
+            return
+        with self.lock:
+            if version != self.version:
+                self._build(version)
+
+    def update(self, drug):
+        new_version = bump_namespace_version(VERSION_NAMESPACE)
+        with self.lock:
+            # patch in place only when no other worker changed the drugs since
+            # this index was loaded; otherwise the next search rebuilds it
+            if self.version is not None and self.version == new_version - 1:
+                self._remove(drug.id)
+                fields = {}
+                for field in FIELD_WEIGHTS:
+                    fields[field] = getattr(drug, field)
+                self._add(drug.id, fields)
+                self.version = new_version
+
+    def invalidate(self):
+        bump_namespace_version(VERSION_NAMESPACE)
+
+    def _prefix_scores(self, term):
+        # A query term matches every indexed token it is a prefix of, so that
+        # "ibu" finds "ibuprofen"; exact matches score higher than prefixes.
+        scores = {}
+        i = bisect.bisect_left(self.sorted_tokens, term)
+        while i < len(self.sorted_tokens) and self.sorted_tokens[i].startswith(term):
+            token = self.sorted_tokens[i]
+            factor = 1.0 if token == term else 0.5
+            for drug_id, weight in self.postings[token].items():
+                scores[drug_id] = scores.get(drug_id, 0.0) + weight * factor
+            i += 1
+        return scores
+
+    def search(self, query):
+        terms = tokenize(query)
+        if len(terms) == 0:
+            return []
+        self.ensure_current()
+
+        with self.lock:
+            totals = None
+            for term in terms:
+                scores = self._prefix_scores(term)
+                if totals is None:
+                    totals = scores
+                    continue
+                # every term has to match somewhere in the drug
+                merged = {}
+                for drug_id in totals:
+                    if drug_id in scores:
+                        merged[drug_id] = totals[drug_id] + scores[drug_id]
+                totals = merged
+                if len(totals) == 0:
+                    break
+
+        return sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+
+
+drug_index = InvertedIndex()
+
+
+def fulltext_boolean_query(query):
+    terms = tokenize(query)
+    parts = []
+    for term in terms:
+        if len(term) >= FULLTEXT_MIN_TOKEN_SIZE:
+            parts.append("+" + term + "*")
+    return " ".join(parts)
+
+
+def search_drugs(qs, query):
+    if use_fulltext():
+        boolean_query = fulltext_boolean_query(query)
+        if len(boolean_query) == 0:
+            # only very short terms, which the FULLTEXT index cannot answer
+            return qs.filter(name__icontains=query.strip()).annotate(
+                relevance=Value(1.0, output_field=FloatField())
+            )
+        relevance = RawSQL(
+            "MATCH (name, active_ingredient, indications) AGAINST (%s IN BOOLEAN MODE)",
+            (boolean_query,),
+            output_field=FloatField(),
+        )
+        return qs.annotate(relevance=relevance).filter(relevance__gt=0)
+
+    ranked = drug_index.search(query)
+    if len(ranked) == 0:
+        return qs.none().annotate(relevance=Value(0.0, output_field=FloatField()))
+
+    if len(ranked) > MAX_SCORED_RESULTS and qs.query.has_filters():
+        # rank among the drugs the category and stock filters let through,
+        # so the scored rows are the best ones of this list
+        allowed_ids = set(qs.values_list("id", flat=True))
+        ranked = [item for item in ranked if item[0] in allowed_ids]
+
+    whens = []
+    for drug_id, score in ranked[:MAX_SCORED_RESULTS]:
+        whens.append(When(id=drug_id, then=Value(score)))
+    relevance = Value(0.0, output_field=FloatField())
+    if len(whens) > 0:
+        relevance = Case(*whens, default=Value(0.0), output_field=FloatField())
+    ids = [drug_id for drug_id, score in ranked]
+    return qs.filter(id__in=ids).annotate(relevance=relevance)
+
+
+def index_drug(drug):
+    if not use_fulltext():
+        drug_index.update(drug)
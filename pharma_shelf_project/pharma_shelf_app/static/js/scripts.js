@@ -136,4 +136,130 @@ if (drugAlert && typeof Swal !== "undefined") {
     }
 }
 
+    var typeaheads = document.querySelectorAll(".pharma-typeahead");
+    for (var t = 0; t < typeaheads.length; t++) {
+        setupDrugTypeahead(typeaheads[t]);
+    }
+
+    function setupDrugTypeahead(container) {
+        var url = container.dataset.url;
+        var excludeId = container.dataset.excludeId || "";
+        var multipleName = container.dataset.multiple || "";
+        var textInput = container.querySelector(".pharma-typeahead-input");
+        var hiddenInput = container.querySelector("input[type=hidden]");
+        var resultsBox = container.querySelector(".pharma-typeahead-results");
+        var selectedBox = container.querySelector(".pharma-typeahead-selected");
+        var timer = null;
+        var lastQuery = "";
+
+        if (!url || !textInput || !resultsBox) {
+            return;
+        }
+
+        function clearResults() {
+            resultsBox.innerHTML = "";
+        }
+
+        function addChip(id, name) {
+            var existing = selectedBox.querySelectorAll("input[name='" + multipleName + "']");
+            for (var i = 0; i < existing.length; i++) {
+                if (existing[i].value === String(id)) {
+                    return;
+                }
+            }
+            var chip = document.createElement("span");
+            chip.className = "badge bg-primary pharma-typeahead-chip";
+            chip.textContent = name + " ";
+            var input = document.createElement("input");
+            input.type = "hidden";
+            input.name = multipleName;
+            input.value = id;
+            chip.appendChild(input);
+            selectedBox.appendChild(chip);
+        }
+
+        function choose(item) {
+            if (multipleName && selectedBox) {
+                addChip(item.id, item.name);
+                textInput.value = "";
+            } else {
+                textInput.value = item.name;
+                if (hiddenInput) {
+                    hiddenInput.value = item.id;
+                }
+            }
+            clearResults();
+        }
+
+        function showResults(results) {
+            clearResults();
+            for (var i = 0; i < results.length; i++) {
+                if (excludeId && String(results[i].id) === excludeId) {
+                    continue;
+                }
+                var option = document.createElement("button");
+                option.type = "button";
+                option.className = "list-group-item list-group-item-action";
+                option.textContent = results[i].name + (results[i].dosage_form ? " (" + results[i].dosage_form + ")" : "");
+                option.addEventListener("click", choose.bind(null, results[i]));
+                resultsBox.appendChild(option);
+            }
+        }
+
+        function fetchResults() {
+            var query = textInput.value.trim();
+            lastQuery = query;
+            if (query.length === 0) {
+                clearResults();
+                return;
+            }
+            fetch(url + "?q=" + encodeURIComponent(query), { credentials: "same-origin" })
+                .then(function (response) {
+                    return response.json();
+                })
+                .then(function (data) {
+                    // ignore responses for queries the user has already typed past
+                    if (query === lastQuery && data.results) {
+                        showResults(data.results);
+                    }
+                })
+                .catch(function () {
+                    clearResults();
+                });
+        }
+
+        textInput.addEventListener("input", function () {
+            if (hiddenInput && !multipleName) {
+                hiddenInput.value = "";
+            }
+            clearTimeout(timer);
+            timer = setTimeout(fetchResults, 200);
+        });
+
+        textInput.addEventListener("keydown", function (e) {
+            if (e.key === "Enter") {
+                var first = resultsBox.querySelector("button");
+                if (first) {
+                    e.preventDefault();
+                    first.click();
+                }
+            }
+        });
+
+        if (selectedBox) {
+            selectedBox.addEventListener("click", function (e) {
+                var chip = e.target.closest(".pharma-typeahead-chip");
+                if (chip) {
+                    chip.remove();
+                }
+            });
+        }
+
+        document.addEventListener("click", function (e) {
+            if (!container.contains(e.target)) {
+                clearResults();
+            }
+        });
+    }
+
 });
@@ -0,0 +1,177 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .storage import get_encoders, is_compressible
+
+
+# Serves collected static files from STATIC_ROOT: picks the precompressed
+# variant the client accepts, marks content-hashed names as immutable, and
+# answers byte ranges (the auth page video needs them to seek and stream).
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+# unhashed names (files referenced without {% static %}) are revalidated
+UNHASHED_MAX_AGE = 60
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def get_hashed_names():
+    try:
+        manifest = staticfiles_storage.load_manifest()
+    except AttributeError:
+        return set()
+    return set(manifest.values())
+
+
+def resolve_path(relative_path):
+    root = os.path.realpath(str(settings.STATIC_ROOT))
+    path = os.path.realpath(os.path.join(root, relative_path))
+    if not path.startswith(root + os.sep) or not os.path.isfile(path):
+        return None
+    return path
+
+
+def get_accepted_encodings(request):
+    accepted = []
+    for part in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        params = part.split(";")
+        quality = 1.0
+        for param in params[1:]:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.append(params[0].strip().lower())
+    return accepted
+
+
+def choose_variant(request, path, relative_path):
+    # ranges are only served from the identity file
+    if not is_compressible(relative_path) or "HTTP_RANGE" in request.META:
+        return path, None
+    accepted = get_accepted_encodings(request)
+    for encoding, suffix, compress in get_encoders():
+        if encoding in accepted and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return path, None
+
+
+def parse_range(header, size):
+    # Only single ranges are supported; anything else is answered with the
+    # whole file, which RFC 7233 allows.
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if start == "" and end == "":
+        return None
+    if start == "":
+        length = int(end)
+        if length == 0:
+            return "unsatisfiable"
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = size - 1 if end == "" else min(int(end), size - 1)
+    if start >= size or start > end:
+        return "unsatisfiable"
+    return start, end
+
+
+class RangeFileWrapper:
+    def __init__(self, file, start, length, block_size=64 * 1024):
+        self.file = file
+        self.remaining = length
+        self.block_size = block_size
+        self.file.seek(start)
+
+    def __iter__(self):
+        while self.remaining > 0:
+            data = self.file.read(min(self.block_size, self.remaining))
+            if not data:
+                break
+            self.remaining -= len(data)
+            yield data
+
+    def close(self):
+        self.file.close()
+
+
+def make_etag(stat, encoding):
+    # each encoded variant is a different representation, so it needs its
+    # own strong validator
+    etag = "%x-%x" % (int(stat.st_mtime), stat.st_size)
+    if encoding is not None:
+        etag += "-" + encoding
+    return '"' + etag + '"'
+
+
+def serve(request, relative_path, hashed_names):
+    path = resolve_path(relative_path)
+    if path is None:
+        return None
+
+    stat = os.stat(path)
+    served_path, encoding = choose_variant(request, path, relative_path)
+    etag = make_etag(os.stat(served_path), encoding)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        response = not_modified
+    else:
+        response = build_response(request, path, relative_path, stat, etag, served_path, encoding)
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    response["Accept-Ranges"] = "bytes"
+    if is_compressible(relative_path):
+        response["Vary"] = "Accept-Encoding"
+    if relative_path in hashed_names:
+        response["Cache-Control"] = "public, max-age=%d, immutable" % IMMUTABLE_MAX_AGE
+    else:
+        response["Cache-Control"] = "public, max-age=%d" % UNHASHED_MAX_AGE
+    return response
+
+
+def build_response(request, path, relative_path, stat, etag, served_path, encoding):
+    content_type = mimetypes.guess_type(relative_path)[0] or "application/octet-stream"
+    size = stat.st_size
+
+    byte_range = None
+    if "HTTP_RANGE" in request.META:
+        if_range = request.META.get("HTTP_IF_RANGE")
+        if if_range is None or if_range == etag:
+            byte_range = parse_range(request.META["HTTP_RANGE"], size)
+
+    if byte_range == "unsatisfiable":
+        response = HttpResponse(status=416)
+        response["Content-Range"] = "bytes */%d" % size
+        return response
+
+    if byte_range is not None:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            RangeFileWrapper(open(path, "rb"), start, end - start + 1),
+            status=206,
+            content_type=content_type
+        )
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Range"] = "bytes %d-%d/%d" % (start, end, size)
+        return response
+
+    response = FileResponse(
+        open(served_path, "rb"),
+        content_type=content_type,
+        filename=os.path.basename(relative_path)
+    )
+    if encoding is not None:
+        response["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,76 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Images and video are already compressed; only text assets get variants.
+COMPRESSIBLE_EXTENSIONS = [".css", ".js", ".svg", ".html", ".txt", ".json", ".map", ".xml"]
+
+# variants that do not save at least this fraction are not written
+MIN_SAVING = 0.05
+
+
+def is_compressible(name):
+    return os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS
+
+
+def compress_gzip(content):
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def compress_brotli(content):
+    return brotli.compress(content, quality=11)
+
+
+def get_encoders():
+    encoders = [("gzip", ".gz", compress_gzip)]
+    if brotli is not None:
+        encoders.insert(0, ("br", ".br", compress_brotli))
+    return encoders
+
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # collectstatic writes content-hashed copies (style.3f2a....css) plus the
+    # manifest, then a .br and .gz next to every compressible file, so the
+    # serving layer never compresses on the fly.
+
+    # With DEBUG off and nothing collected yet (tests, a fresh checkout),
+    # {% static %} links the plain name instead of failing the page.
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # not collected, so there is no file to hash either
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            yield name, hashed_name, processed
+
+        if dry_run:
+            return
+
+        for name in self.hashed_files.values():
+            if is_compressible(name):
+                self.write_compressed_variants(name)
+
+    def write_compressed_variants(self, name):
+        with self.open(name) as original:
+            content = original.read()
+
+        for encoding, suffix, compress in get_encoders():
+            compressed = compress(content)
+            if len(compressed) > len(content) * (1 - MIN_SAVING):
+                continue
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(compressed))
@@ -1,3 +1,1025 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import time
+from collections import deque
+from contextlib import redirect_stdout
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import bcrypt
+import numpy as np
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import (
+    AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from . import (
+    caching, catalog_import, db_connections, db_router, forecasting, models, notifications, passwords, search,
+    throttling
+)
+from .interaction_graph import InteractionGraph, interaction_graph
+from .checks import check_atomic_throttle
+from .middleware import ReplicaReadMiddleware, StaticAssetMiddleware
+
+
+THROTTLE_SETTINGS = {
+    "CACHES": {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    "LOGIN_THROTTLE_WINDOW_SECONDS": 60,
+    "LOGIN_THROTTLE_EMAIL_LIMIT": 3,
+    "LOGIN_THROTTLE_IP_LIMIT": 5,
+    "LOGIN_LOCKOUT_BASE_SECONDS": 30,
+    "LOGIN_LOCKOUT_MAX_SECONDS": 100,
+    "BCRYPT_ROUNDS": 4,
+    "TRUSTED_PROXIES": [],
+}
+
+
+class CatalogMixin:
+    def create_user(self, role="admin", email="admin@x.com"):
+        return models.User.objects.create(name="Admin", email=email, password_hash="x", role=role)
+
+    def log_in(self, user):
+        session = self.client.session
+        session["user_id"] = user.id
+        session.save()
+
+    def create_category(self, name="Analgesics"):
+        return models.create_category({"name": name, "description": ""})
+
+    def create_drug(self, name, category, stock="10", indications="Relief of mild pain"):
+        return models.create_drug(
+            {
+                "name": name,
+                "active_ingredient": name,
+                "dosage_form": "Tablet",
+                "indications": indications,
+                "side_effects": "",
+                "stock_quantity": stock,
+                "category_id": category.id,
+            },
+            self.user.id,
+        )
+
+
+@override_settings(**THROTTLE_SETTINGS)
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_email_locked_out_after_limit(self):
+        now = 1000.0
+        for i in range(2):
+            throttling.record_failure("a@x.com", "10.0.0.1", now + i)
+        self.assertEqual(throttling.get_lockout_remaining("a@x.com", "10.0.0.2", now + 2), 0)
+
+        throttling.record_failure("a@x.com", "10.0.0.1", now + 2)
+        self.assertEqual(throttling.get_lockout_remaining("a@x.com", "10.0.0.2", now + 2), 30)
+        self.assertEqual(throttling.get_lockout_remaining(" A@X.com ", "10.0.0.2", now + 12), 20)
+        self.assertEqual(throttling.get_lockout_remaining("b@x.com", "10.0.0.2", now + 2), 0)
+        self.assertEqual(throttling.get_lockout_remaining("a@x.com", "10.0.0.2", now + 32), 0)
+
+    def test_failures_outside_window_are_forgotten(self):
+        throttling.record_failure("a@x.com", "10.0.0.1", 1000.0)
+        throttling.record_failure("a@x.com", "10.0.0.1", 1001.0)
+        throttling.record_failure("a@x.com", "10.0.0.1", 1070.0)
+        self.assertEqual(throttling.get_lockout_remaining("a@x.com", "", 1070.0), 0)
+
+    def test_lockout_doubles_up_to_maximum(self):
+        durations = []
+        now = 1000.0
+        for lockout in range(4):
+            for i in range(3):
+                throttling.record_failure("a@x.com", "", now)
+            durations.append(throttling.get_lockout_remaining("a@x.com", "", now))
+            now += 200
+        self.assertEqual(durations, [30, 60, 100, 100])
+
+    def test_ip_locked_out_across_emails(self):
+        now = 1000.0
+        for i in range(5):
+            throttling.record_failure("user%d@x.com" % i, "10.0.0.1", now)
+        self.assertEqual(throttling.get_lockout_remaining("new@x.com", "10.0.0.1", now), 30)
+        self.assertEqual(throttling.get_lockout_remaining("new@x.com", "10.0.0.9", now), 0)
+
+    def test_success_clears_email_but_not_ip(self):
+        now = 1000.0
+        for i in range(2):
+            throttling.record_failure("a@x.com", "10.0.0.1", now)
+        throttling.record_success("a@x.com", "10.0.0.1", now)
+        throttling.record_failure("a@x.com", "10.0.0.1", now)
+        self.assertEqual(throttling.get_lockout_remaining("a@x.com", "", now), 0)
+
+        for i in range(2):
+            throttling.record_failure("b@x.com", "10.0.0.1", now)
+        self.assertEqual(throttling.get_lockout_remaining("c@x.com", "10.0.0.1", now), 30)
+
+    def test_client_ip_behind_trusted_proxy(self):
+        request = RequestFactory().post(
+            "/login/", REMOTE_ADDR="10.0.0.5", HTTP_X_FORWARDED_FOR="1.2.3.4, 203.0.113.7, 10.0.0.9"
+        )
+        self.assertEqual(throttling.get_client_ip(request), "10.0.0.5")
+        with self.settings(TRUSTED_PROXIES=["10.0.0.0/8"]):
+            self.assertEqual(throttling.get_client_ip(request), "203.0.113.7")
+
+    def test_stats(self):
+        throttling.reset_stats()
+        throttling.check_login_allowed("a@x.com", "10.0.0.1")
+        for i in range(3):
+            throttling.record_failure("a@x.com", "10.0.0.1")
+        throttling.check_login_allowed("a@x.com", "10.0.0.1")
+        self.assertEqual(
+            throttling.get_stats(),
+            {"attempts": 2, "failures": 3, "throttled": 1, "lockouts": 1}
+        )
+
+
+class AtomicThrottleCheckTests(SimpleTestCase):
+    def get_warnings(self, backend, workers):
+        with override_settings(CACHES={"default": {"BACKEND": backend}}, WEB_CONCURRENCY=workers):
+            return [warning.id for warning in check_atomic_throttle(None)]
+
+    def test_warns_on_non_atomic_backends(self):
+        self.assertEqual(self.get_warnings("django.core.cache.backends.memcached.PyMemcacheCache", 4), [])
+        self.assertEqual(self.get_warnings("django.core.cache.backends.locmem.LocMemCache", 1), [])
+        for backend, workers in [
+            ("django.core.cache.backends.locmem.LocMemCache", 2),
+            ("django.core.cache.backends.filebased.FileBasedCache", 1),
+            ("django.core.cache.backends.db.DatabaseCache", 1),
+        ]:
+            self.assertEqual(self.get_warnings(backend, workers), ["pharma_shelf_app.W001"])
+
+
+@override_settings(**THROTTLE_SETTINGS)
+class LoginViewThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pw_hash = bcrypt.hashpw(b"password123", bcrypt.gensalt(4)).decode()
+        self.user = models.User.objects.create(
+            name="Pharmacist", email="p@x.com", password_hash=pw_hash, role="pharmacist"
+        )
+
+    def post_login(self, password, ip="10.0.0.1"):
+        return self.client.post(
+            "/login/", {"email": "p@x.com", "password": password}, REMOTE_ADDR=ip
+        )
+
+    def test_throttled_login_skips_user_lookup_and_bcrypt(self):
+        for i in range(3):
+            self.post_login("wrong")
+
+        with mock.patch.object(models, "get_user_by_email") as get_user, \
+                mock.patch("bcrypt.checkpw") as checkpw:
+            response = self.post_login("password123", ip="10.0.0.2")
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, "/login")
+        get_user.assert_not_called()
+        checkpw.assert_not_called()
+        self.assertNotIn("user_id", self.client.session)
+
+    def test_login_succeeds_below_limit(self):
+        for i in range(2):
+            self.post_login("wrong")
+        response = self.post_login("password123")
+        self.assertEqual(response.url, "/dashboard")
+        self.assertEqual(self.client.session["user_id"], self.user.id)
+
+
+@override_settings(**THROTTLE_SETTINGS)
+class AsyncLoginConcurrencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pw_hash = bcrypt.hashpw(b"password123", bcrypt.gensalt(4)).decode()
+        for i in range(4):
+            models.User.objects.create(
+                name="Pharmacist", email="p%d@x.com" % i, password_hash=pw_hash, role="pharmacist"
+            )
+
+    async def test_concurrent_logins_overlap(self):
+        async def slow_check_password(password, password_hash):
+            await asyncio.sleep(0.5)
+            return True
+
+        async def login(i):
+            # Django 3.2's AsyncClient cannot read multipart bodies back
+            body = urlencode({"email": "p%d@x.com" % i, "password": "password123"})
+            response = await AsyncClient().post("/login/", body, content_type="application/x-www-form-urlencoded")
+            return response.url
+
+        with mock.patch.object(passwords, "acheck_password", slow_check_password):
+            started = time.monotonic()
+            urls = await asyncio.gather(*[login(i) for i in range(4)])
+            elapsed = time.monotonic() - started
+
+        self.assertEqual(urls, ["/dashboard"] * 4)
+        # run one after another the four checks would take 2 seconds
+        self.assertLess(elapsed, 1.5)
+
+
+@override_settings(
+    CACHES=THROTTLE_SETTINGS["CACHES"],
+    DATABASE_REPLICAS=["replica1"],
+    DB_REPLICA_LAG_SECONDS=5,
+)
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = db_router.PrimaryReplicaRouter()
+
+    def route_read(self, use_primary):
+        token = db_router.request_state.set({"use_primary": use_primary, "wrote": False})
+        try:
+            return self.router.db_for_read(models.Drug)
+        finally:
+            db_router.request_state.reset(token)
+
+    def get_response(self, request):
+        self.routed = self.router.db_for_read(models.Drug)
+        if request.method == "POST":
+            self.router.db_for_write(models.Drug)
+        return HttpResponse()
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertEqual(self.router.db_for_read(models.Drug), "default")
+
+    def test_read_requests_use_replica(self):
+        self.assertEqual(self.route_read(False), "replica1")
+        self.assertEqual(self.route_read(True), "default")
+
+    def test_write_pins_only_that_client_to_primary(self):
+        middleware = ReplicaReadMiddleware(self.get_response)
+        factory = RequestFactory()
+
+        response = middleware(factory.post("/drugs/1/stock/update/"))
+        cookie = response.cookies[db_router.PRIMARY_COOKIE]
+        self.assertEqual(cookie["max-age"], 5)
+
+        request = factory.get("/drugs/1/")
+        request.COOKIES[db_router.PRIMARY_COOKIE] = cookie.value
+        response = middleware(request)
+        self.assertEqual(self.routed, "default")
+        self.assertNotIn(db_router.PRIMARY_COOKIE, response.cookies)
+
+        middleware(factory.get("/drugs/1/"))
+        self.assertEqual(self.routed, "replica1")
+
+        request = factory.get("/drugs/1/")
+        request.COOKIES[db_router.PRIMARY_COOKIE] = str(time.time() - 1)
+        middleware(request)
+        self.assertEqual(self.routed, "replica1")
+
+    def test_namespace_bumped_again_after_lag(self):
+        version = caching.bump_namespace_version("drugs")
+        self.assertEqual(caching.get_namespace_version("drugs"), version)
+        with mock.patch("pharma_shelf_app.caching.time.time", return_value=time.time() + 6):
+            self.assertEqual(caching.get_namespace_version("drugs"), version + 1)
+            self.assertEqual(caching.get_namespace_version("drugs"), version + 1)
+
+
+class StaticAssetTests(TestCase):
+    def test_pages_render_without_collected_manifest(self):
+        with self.settings(STATIC_ROOT="/nonexistent/staticfiles"):
+            response = self.client.get("/login/")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "/static/")
+
+    def test_middleware_off_in_debug(self):
+        with self.settings(DEBUG=True):
+            with self.assertRaises(MiddlewareNotUsed):
+                StaticAssetMiddleware(lambda request: HttpResponse())
+
+
+class CanonicalPairsMigrationTests(TransactionTestCase):
+    migrate_from = [("pharma_shelf_app", "0005_drug_fulltext_index")]
+    migrate_to = [("pharma_shelf_app", "0006_canonical_pairs")]
+
+    def tearDown(self):
+        # back to the latest schema for the other tests
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_keep_the_most_severe_row(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        apps = executor.loader.project_state(self.migrate_from).apps
+        User = apps.get_model("pharma_shelf_app", "User")
+        Category = apps.get_model("pharma_shelf_app", "Category")
+        Drug = apps.get_model("pharma_shelf_app", "Drug")
+        DrugInteraction = apps.get_model("pharma_shelf_app", "DrugInteraction")
+
+        user = User.objects.create(name="Admin", email="a@x.com", password_hash="x", role="admin")
+        category = Category.objects.create(name="Analgesics")
+        drugs = []
+        for name in ["Aspirin", "Warfarin", "Ibuprofen"]:
+            drugs.append(
+                Drug.objects.create(
+                    name=name, active_ingredient=name, dosage_form="Tablet", indications="Pain relief",
+                    created_by=user, category=category
+                )
+            )
+        aspirin, warfarin, ibuprofen = drugs
+
+        minor = DrugInteraction.objects.create(drug_a=warfarin, drug_b=aspirin, severity="Minor", description="Old note")
+        major = DrugInteraction.objects.create(drug_a=aspirin, drug_b=warfarin, severity="Major", description="Bleeding risk")
+        older = DrugInteraction.objects.create(drug_a=aspirin, drug_b=ibuprofen, severity="Moderate", description="First")
+        newer = DrugInteraction.objects.create(drug_a=ibuprofen, drug_b=aspirin, severity="moderate", description="Second")
+        DrugInteraction.objects.filter(id=older.id).update(created_at=newer.created_at.replace(year=2020))
+
+        executor = MigrationExecutor(connection)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            executor.migrate(self.migrate_to)
+        apps = executor.loader.project_state(self.migrate_to).apps
+        DrugInteraction = apps.get_model("pharma_shelf_app", "DrugInteraction")
+
+        rows = {row.id: row for row in DrugInteraction.objects.all()}
+        self.assertEqual(sorted(rows), sorted([major.id, newer.id]))
+        self.assertEqual(rows[major.id].severity, "Major")
+        self.assertEqual(rows[major.id].description, "Bleeding risk | Also recorded as Minor: Old note")
+        self.assertEqual((rows[newer.id].drug_a_id, rows[newer.id].drug_b_id), (aspirin.id, ibuprofen.id))
+        self.assertEqual(rows[newer.id].description, "Second | Also recorded as Moderate: First")
+        self.assertIn("interaction %d" % minor.id, output.getvalue())
+        self.assertIn("interaction %d" % older.id, output.getvalue())
+
+
+@override_settings(CACHES=THROTTLE_SETTINGS["CACHES"])
+class FallbackSearchTests(CatalogMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user()
+        self.analgesics = self.create_category()
+        self.other = self.create_category("Other")
+        for i in range(4):
+            self.create_drug("Paincalm %d" % i, self.analgesics)
+        self.best = self.create_drug("Pain Pain", self.analgesics, stock="0")
+        self.outside = self.create_drug("Painaway", self.other, indications="Back pain and stiffness")
+
+    def names(self, qs):
+        return [drug.name for drug in qs]
+
+    def test_ranks_name_matches_first(self):
+        qs = models.get_filtered_drugs("pain", 0, False)
+        self.assertEqual(self.names(qs)[0], "Pain Pain")
+
+    @mock.patch.object(search, "MAX_SCORED_RESULTS", 2)
+    def test_matches_past_the_scored_cap_are_kept(self):
+        qs = models.get_filtered_drugs("pain", 0, False)
+        self.assertEqual(qs.count(), 6)
+        self.assertEqual(len(list(models.iter_drug_export_rows(qs))), 6)
+
+        qs = models.get_filtered_drugs("pain", self.other.id, False)
+        self.assertEqual(self.names(qs), ["Painaway"])
+
+        qs = models.get_filtered_drugs("pain", self.analgesics.id, True)
+        self.assertEqual(qs.count(), 4)
+
+
+@override_settings(CACHES=THROTTLE_SETTINGS["CACHES"])
+class InteractionCheckerTests(CatalogMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user()
+        self.log_in(self.user)
+
+    def test_malformed_drug_id_is_a_form_error(self):
+        response = self.client.get("/interactions/check/", {"drug_a_id": "x", "drug_b_id": "2"})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Select both drugs from the suggestions.")
+        self.assertFalse(response.context["has_checked"])
+
+    def test_oversized_regimen_is_rejected_not_truncated(self):
+        drug_ids = [str(i) for i in range(1, 53)]
+        with mock.patch.object(models, "get_interactions_for_regimen") as get_interactions:
+            response = self.client.get("/interactions/check/", {"drug_ids": drug_ids})
+            json_response = self.client.get("/interactions/check/json/", {"drug_ids": drug_ids})
+
+        self.assertContains(response, "at most 50 drugs; 52 were selected")
+        self.assertFalse(response.context["has_checked"])
+        self.assertEqual(json_response.status_code, 400)
+        get_interactions.assert_not_called()
+
+
+IMPORT_CSV = """name,active_ingredient,dosage_form,indications,side_effects,stock_quantity,category
+Aspirin,Acetylsalicylic acid,Tablet,Pain and fever relief,,12,Analgesics
+Aspirin,Acetylsalicylic acid,Tablet,Pain and fever relief,,30,Analgesics
+,Nothing,Tablet,Missing its name here,,1,Analgesics
+Ibuprofen,Ibuprofen,Tablet,Pain and inflammation,,abc,Analgesics
+Amoxicillin,Amoxicillin,Capsule,Bacterial infections,,0,Antibiotics
+""" + "X" * 151 + """,Long,Tablet,Name is far too long,,5,Analgesics
+"""
+
+
+@override_settings(CACHES=THROTTLE_SETTINGS["CACHES"])
+class CatalogImportTests(CatalogMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user()
+
+    def test_csv_import_skips_bad_rows(self):
+        result = catalog_import.import_catalog(io.StringIO(IMPORT_CSV), "csv", self.user.id, batch_size=2)
+
+        self.assertEqual((result["imported"], result["skipped"], result["categories_created"]), (3, 3, 2))
+        self.assertEqual(
+            [error.split(":")[0] for error in result["errors"]], ["Row 3", "Row 4", "Row 6"]
+        )
+        self.assertIn("Stock quantity must be a number.", result["errors"][1])
+
+        # duplicate names in one batch each get their own movement
+        movements = models.StockMovement.objects.filter(reason="initial")
+        self.assertEqual(
+            sorted((movement.drug.name, movement.drug.stock_quantity, movement.change) for movement in movements),
+            [("Aspirin", 12, 12), ("Aspirin", 30, 30)],
+        )
+        self.assertEqual(models.verify_inventory_counters(), [])
+
+    def test_ndjson_import_reports_lines_that_are_not_objects(self):
+        lines = [
+            json.dumps({"name": "Cetirizine", "active_ingredient": "Cetirizine", "dosage_form": "Tablet",
+                        "indications": "Allergic rhinitis", "stock_quantity": 4, "category": "Antihistamines"}),
+            "[1, 2]",
+            "{not json",
+        ]
+        result = catalog_import.import_catalog(io.StringIO("\n".join(lines)), "ndjson", self.user.id)
+
+        self.assertEqual((result["imported"], result["skipped"]), (1, 2))
+        self.assertEqual(models.Drug.objects.get().category.name, "Antihistamines")
+
+    def test_non_utf8_upload_is_a_form_error(self):
+        self.log_in(self.user)
+        upload = SimpleUploadedFile("catalog.csv", IMPORT_CSV.replace("Aspirin", "Aspirín").encode("latin-1"))
+        response = self.client.post("/drugs/import/", {"catalog_file": upload}, follow=True)
+
+        self.assertContains(response, "must be UTF-8 encoded text; nothing was imported")
+        self.assertEqual(models.Drug.objects.count(), 0)
+
+
+@override_settings(CACHES=THROTTLE_SETTINGS["CACHES"])
+class StockMovementTests(CatalogMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user()
+        self.drug = self.create_drug("Aspirin", self.create_category(), stock="5")
+
+    def stock(self):
+        return models.Drug.objects.get(id=self.drug.id).stock_quantity
+
+    def test_dispense(self):
+        self.assertEqual(models.dispense_drug_stock(self.drug.id, 2), "dispensed")
+        self.assertEqual(models.dispense_drug_stock(self.drug.id, 4), "insufficient")
+        self.assertEqual(self.stock(), 3)
+        self.assertEqual(models.dispense_drug_stock(self.drug.id, 3), "out_of_stock")
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual(models.dispense_drug_stock(self.drug.id + 100, 1), "not_found")
+
+        changes = list(models.StockMovement.objects.filter(reason="dispense").values_list("change", flat=True))
+        self.assertEqual(sorted(changes), [-3, -2])
+        self.assertEqual(models.verify_inventory_counters(), [])
+
+    def test_receive(self):
+        models.dispense_drug_stock(self.drug.id, 5)
+        self.assertEqual(models.receive_drug_stock(self.drug.id, 7), "received")
+        self.assertEqual(self.stock(), 7)
+        self.assertEqual(models.receive_drug_stock(self.drug.id, models.MAX_STOCK_QUANTITY), "too_large")
+        self.assertEqual(self.stock(), 7)
+        self.assertEqual(models.receive_drug_stock(self.drug.id + 100, 1), "not_found")
+        self.assertEqual(models.verify_inventory_counters(), [])
+
+    def test_dispense_view_reports_missing_drug(self):
+        self.log_in(self.user)
+        response = self.client.post("/drugs/%d/stock/dispense/" % (self.drug.id + 100), {"quantity": "1"}, follow=True)
+        self.assertContains(response, "Drug not found.")
+        self.assertNotContains(response, "Not enough stock")
+
+    def test_quantity_bound(self):
+        errors = models.Drug.objects.validate_stock_movement({"quantity": str(models.MAX_STOCK_QUANTITY + 1)})
+        self.assertEqual(errors, {"quantity": "Quantity is too large."})
+
+
+@override_settings(CACHES=THROTTLE_SETTINGS["CACHES"])
+class BulkStockUpdateTests(CatalogMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user()
+        category = self.create_category()
+        self.aspirin = self.create_drug("Aspirin", category, stock="5")
+        self.ibuprofen = self.create_drug("Ibuprofen", category, stock="0")
+
+    def test_updates_in_one_transaction(self):
+        errors, out_of_stock = models.bulk_update_drug_stock(
+            [(self.aspirin.id, "0"), (self.ibuprofen.id, "8"), (self.ibuprofen.id, "9")]
+        )
+        self.assertEqual((errors, [drug.id for drug in out_of_stock]), ({}, [self.aspirin.id]))
+        self.assertEqual(models.Drug.objects.get(id=self.ibuprofen.id).stock_quantity, 9)
+        self.assertEqual(models.verify_inventory_counters(), [])
+
+    def test_any_bad_entry_rejects_the_whole_update(self):
+        too_large = str(models.MAX_STOCK_QUANTITY + 1)
+        errors, out_of_stock = models.bulk_update_drug_stock([(self.aspirin.id, "0"), (self.ibuprofen.id, too_large)])
+        self.assertEqual(errors, {self.ibuprofen.id: "Stock quantity is too large."})
+
+        errors, out_of_stock = models.bulk_update_drug_stock([(self.aspirin.id, "0"), (self.ibuprofen.id + 100, "1")])
+        self.assertEqual(errors, {self.ibuprofen.id + 100: "Drug does not exist."})
+        self.assertEqual(models.Drug.objects.get(id=self.aspirin.id).stock_quantity, 5)
+
+
+@override_settings(CACHES=THROTTLE_SETTINGS["CACHES"], DB_CONN_HEALTH_CHECKS=True, DB_HEALTH_CHECK_IDLE_SECONDS=10)
+class DbConnectionTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        db_connections.reset_stats()
+        caching.reset_stats()
+
+    def check(self, *kept):
+        with mock.patch.object(db_connections, "connections", mock.Mock(all=mock.Mock(return_value=kept))):
+            db_connections.check_connections()
+
+    def test_only_idle_connections_are_pinged(self):
+        now = time.monotonic()
+        busy = mock.Mock(connection=object(), last_used_at=now - 1)
+        idle = mock.Mock(connection=object(), last_used_at=now - 60)
+        dropped = mock.Mock(connection=object(), last_used_at=now - 60)
+        dropped.is_usable.return_value = False
+        closed = mock.Mock(connection=None)
+        self.check(busy, idle, dropped, closed)
+
+        busy.is_usable.assert_not_called()
+        idle.is_usable.assert_called_once_with()
+        idle.close.assert_not_called()
+        dropped.close.assert_called_once_with()
+        closed.is_usable.assert_not_called()
+        self.assertGreaterEqual(idle.last_used_at, now)
+
+        stats = db_connections.get_stats()
+        self.assertEqual((stats["reused"], stats["health_check_failures"]), (2, 1))
+
+    def test_pool_runs_in_the_request_context(self):
+        async def run():
+            db_router.request_state.set({"use_primary": False, "wrote": False})
+            await db_connections.run_in_pool(db_router.record_write)
+            return db_router.request_state.get()
+
+        with mock.patch.object(db_connections, "close_old_connections"):
+            state = asyncio.run(run())
+        self.assertEqual(state, {"use_primary": True, "wrote": True})
+        self.assertEqual(db_connections.get_stats()["pool_waits"], 1)
+
+    def test_stats_without_any_lookups(self):
+        self.assertEqual(db_connections.get_stats()["average_pool_wait_ms"], 0.0)
+        cache.set(caching.stats.names_key(), ["drugs:hits"], None)
+        self.assertEqual(caching.get_stats(), {"drugs": {"hits": 0, "misses": 0, "hit_rate": 0.0}})
+
+
+class FailingTransport:
+    def send(self, to_emails, subject, plain_text, html_content):
+        raise OSError("connection refused")
+
+
+@override_settings(CACHES=THROTTLE_SETTINGS["CACHES"])
+class NotificationWorkerTests(CatalogMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user()
+        category = self.create_category()
+        self.drugs = [self.create_drug(name, category, stock="0") for name in ["Aspirin", "Ibuprofen"]]
+        models.enqueue_out_of_stock_notifications(self.drugs, "http://testserver/")
+        self.now = timezone.now()
+
+    def process(self, transport, seconds_later=0):
+        with mock.patch.object(notifications.timezone, "now", return_value=self.now + timedelta(seconds=seconds_later)):
+            return notifications.process_notifications(transport)
+
+    def test_batches_out_of_stock_drugs_into_one_message(self):
+        transport = notifications.StubTransport()
+        self.assertEqual(self.process(transport), (2, 1))
+        self.assertEqual([message["subject"] for message in transport.outbox], ["2 drugs out of stock"])
+        self.assertEqual(self.process(transport, 3600), (0, 0))
+
+    def test_failed_sends_back_off_then_give_up(self):
+        self.assertEqual(self.process(FailingTransport()), (2, 0))
+        job = models.NotificationJob.objects.order_by("id").first()
+        self.assertEqual((job.status, job.attempts), ("pending", 1))
+        self.assertEqual(job.last_error, "OSError('connection refused')")
+
+        elapsed = 0
+        for attempt in range(1, notifications.MAX_ATTEMPTS):
+            delay = notifications.BACKOFF_BASE * 2 ** (attempt - 1)
+            self.assertEqual(self.process(FailingTransport(), elapsed + delay - 1), (0, 0))
+            elapsed += delay
+            self.assertEqual(self.process(FailingTransport(), elapsed), (2, 0))
+
+        statuses = models.NotificationJob.objects.values_list("status", "attempts")
+        self.assertEqual(list(statuses), [("failed", notifications.MAX_ATTEMPTS)] * 2)
+        self.assertEqual(self.process(notifications.StubTransport(), elapsed + 86400), (0, 0))
+
+    def test_stub_outbox_is_bounded(self):
+        transport = notifications.StubTransport()
+        for i in range(notifications.STUB_OUTBOX_SIZE + 5):
+            transport.send(["a@x.com"], "Subject " + str(i), "", "")
+        self.assertEqual(len(transport.outbox), notifications.STUB_OUTBOX_SIZE)
+        self.assertEqual(transport.outbox[0]["subject"], "Subject 5")
+        self.assertEqual(notifications.StubTransport().outbox, deque())
+
+
+@override_settings(CACHES=THROTTLE_SETTINGS["CACHES"])
+class FragmentCacheQueryTests(CatalogMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user(role="pharmacist", email="p@x.com")
+        self.log_in(self.user)
+        category = self.create_category()
+        drugs = [
+            self.create_drug(name, category)
+            for name in ["Aspirin", "Ibuprofen", "Naproxen", "Paracetamol", "Diclofenac", "Ketoprofen"]
+        ]
+        self.out_of_stock = self.create_drug("Celecoxib", category, stock="0")
+        models.create_alternative({"drug_id": self.out_of_stock.id, "alternative_drug_id": drugs[0].id, "note": ""})
+
+    def get_catalog_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [query["sql"] for query in queries.captured_queries if "django_session" not in query["sql"]]
+
+    def test_cached_fragments_skip_their_queries(self):
+        urls = [
+            "/dashboard/",
+            "/drugs/?page=2",
+            "/drugs/?paging=cursor",
+            "/drugs/?q=pain",
+            "/categories/",
+            "/drugs/" + str(self.out_of_stock.id) + "/",
+        ]
+        first_queries = [self.get_catalog_queries(url) for url in urls]
+        for url in urls[:-1]:
+            self.assertEqual(self.get_catalog_queries(url), [], url)
+
+        # the drug itself is shown outside the fragments, its alternatives
+        # and in-stock substitutes inside them
+        queries = self.get_catalog_queries(urls[-1])
+        self.assertLess(len(queries), len(first_queries[-1]))
+        self.assertFalse([query for query in queries if 'FROM "pharma_shelf_app_drugalternative"' in query])
+
+    def test_pagination_is_rendered_from_the_listing(self):
+        response = self.client.get("/drugs/?page=9")
+        self.assertContains(response, "Paracetamol")
+        self.assertContains(response, '<li class="page-item active">', html=False)
+        response = self.client.get("/drugs/?paging=cursor")
+        self.assertContains(response, "About 7 drugs")
+        self.assertContains(response, "?paging=cursor&cursor=")
+
+
+@override_settings(CACHES=THROTTLE_SETTINGS["CACHES"])
+class InventoryCounterTests(CatalogMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user()
+        self.analgesics = self.create_category()
+        self.antibiotics = self.create_category("Antibiotics")
+        self.aspirin = self.create_drug("Aspirin", self.analgesics, stock="2")
+        self.ibuprofen = self.create_drug("Ibuprofen", self.analgesics, stock="0")
+
+    def get_counts(self):
+        return models.get_inventory_counters()[0]
+
+    def test_counters_follow_stock_operations(self):
+        self.assertEqual(
+            self.get_counts(),
+            {"drugs": 2, "drugs_in_stock": 1, "drugs_out_of_stock": 1, "interactions": 0}
+        )
+
+        models.dispense_drug_stock(self.aspirin.id, 2)
+        models.receive_drug_stock(self.ibuprofen.id, 5)
+        self.assertEqual(self.get_counts()["drugs_in_stock"], 1)
+        models.bulk_update_drug_stock([(self.aspirin.id, "3"), (self.ibuprofen.id, "3")])
+        self.assertEqual(self.get_counts()["drugs_in_stock"], 2)
+
+        models.update_drug_details(self.ibuprofen.id, {
+            "name": "Ibuprofen",
+            "active_ingredient": "Ibuprofen",
+            "dosage_form": "Tablet",
+            "indications": "",
+            "side_effects": "",
+            "stock_quantity": "0",
+            "category_id": self.antibiotics.id,
+        })
+        models.create_interaction({
+            "drug_a_id": self.aspirin.id, "drug_b_id": self.ibuprofen.id,
+            "severity": "moderate", "description": "",
+        })
+
+        self.assertEqual(
+            self.get_counts(),
+            {"drugs": 2, "drugs_in_stock": 1, "drugs_out_of_stock": 1, "interactions": 1}
+        )
+        self.assertEqual(models.verify_inventory_counters(), [])
+        stats = models.get_catalog_stats()
+        self.assertEqual((stats["total_drugs"], stats["total_categories"]), (2, 2))
+        self.assertEqual(stats["categories_chart_counts"], [1, 1])
+
+    def test_drift_is_reported_and_rebuilt(self):
+        models.InventoryCounter.objects.filter(name="drugs_in_stock").update(value=7)
+        models.CategoryDrugCounter.objects.filter(category_id=self.analgesics.id).delete()
+        self.assertEqual(
+            sorted(models.verify_inventory_counters()),
+            [("category:" + str(self.analgesics.id), None, 2), ("drugs_in_stock", 7, 1)]
+        )
+
+        models.rebuild_inventory_counters()
+        self.assertEqual(models.verify_inventory_counters(), [])
+        self.assertEqual(self.get_counts()["drugs_in_stock"], 1)
+
+
+@override_settings(CACHES=THROTTLE_SETTINGS["CACHES"])
+class DrugCursorTests(CatalogMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user()
+        category = self.create_category()
+        # two drugs share a name, so the id breaks the tie
+        for name in ["Aspirin", "Codeine", "Codeine", "Ibuprofen", "Naproxen"]:
+            self.create_drug(name, category)
+        self.qs = models.get_filtered_drugs("", 0, False)
+        self.ids = list(self.qs.values_list("id", flat=True))
+
+    def get_page(self, cursor):
+        drugs, next_cursor, previous_cursor = models.get_drugs_page_by_cursor(self.qs, cursor, 2)
+        return [drug.id for drug in drugs], next_cursor, previous_cursor
+
+    def test_pages_forward_and_back(self):
+        first, next_cursor, previous_cursor = self.get_page("")
+        self.assertEqual((first, previous_cursor), (self.ids[0:2], None))
+
+        second, next_cursor, previous_cursor = self.get_page(next_cursor)
+        self.assertEqual(second, self.ids[2:4])
+        self.assertEqual(self.get_page(previous_cursor)[0], first)
+
+        last, next_cursor, previous_cursor = self.get_page(next_cursor)
+        self.assertEqual((last, next_cursor), (self.ids[4:], None))
+        self.assertEqual(self.get_page(previous_cursor)[0], second)
+
+    def test_garbage_cursor_starts_over(self):
+        for cursor in ["not-a-cursor", "e30", models.encode_drug_cursor(self.qs[0], "next")[:-3] + "!!!"]:
+            self.assertIsNone(models.decode_drug_cursor(cursor))
+            self.assertEqual(self.get_page(cursor)[0], self.ids[0:2])
+
+        self.log_in(self.user)
+        response = self.client.get("/drugs/", {"paging": "cursor", "cursor": "%%%"})
+        self.assertContains(response, "About 5 drugs")
+
+
+@override_settings(CACHES=THROTTLE_SETTINGS["CACHES"])
+class InteractionGraphTests(CatalogMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user()
+        category = self.create_category()
+        self.drugs = [self.create_drug(name, category) for name in ["Aspirin", "Warfarin", "Ibuprofen"]]
+        self.ids = [drug.id for drug in self.drugs]
+
+    def add_interaction(self, drug_a, drug_b, severity):
+        with self.captureOnCommitCallbacks(execute=True):
+            return models.create_interaction({
+                "drug_a_id": drug_a.id, "drug_b_id": drug_b.id, "severity": severity, "description": "",
+            })
+
+    def get_pairs(self, graph=interaction_graph):
+        return sorted((i.drug_a.name, i.drug_b.name, i.severity) for i in graph.get_interactions(self.ids))
+
+    def test_new_interaction_is_patched_into_the_loaded_graph(self):
+        self.assertEqual(self.get_pairs(), [])
+        self.add_interaction(self.drugs[1], self.drugs[0], "major")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_pairs(), [("Aspirin", "Warfarin", "major")])
+
+    def test_other_workers_reload_after_a_write(self):
+        other_worker = InteractionGraph()
+        self.assertEqual(self.get_pairs(other_worker), [])
+        self.add_interaction(self.drugs[0], self.drugs[2], "moderate")
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_pairs(other_worker), [("Aspirin", "Ibuprofen", "moderate")])
+
+    def test_rename_reloads_interaction_names(self):
+        self.add_interaction(self.drugs[0], self.drugs[1], "major")
+        self.assertEqual(self.get_pairs(), [("Aspirin", "Warfarin", "major")])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.update_drug_details(self.drugs[0].id, {
+                "name": "Acetylsalicylic acid",
+                "active_ingredient": "Acetylsalicylic acid",
+                "dosage_form": "Tablet",
+                "indications": "",
+                "side_effects": "",
+                "stock_quantity": "10",
+                "category_id": self.drugs[0].category_id,
+            })
+        self.assertEqual(self.get_pairs(), [("Acetylsalicylic acid", "Warfarin", "major")])
+
+
+@override_settings(CACHES=THROTTLE_SETTINGS["CACHES"])
+class SubstituteTests(CatalogMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user()
+        category = self.create_category()
+        stock = {"A": "0", "B": "0", "C": "3", "D": "8", "E": "5", "F": "1", "G": "9"}
+        self.drugs = {name: self.create_drug(name, category, stock=stock[name]) for name in stock}
+        self.links = {}
+        with self.captureOnCommitCallbacks(execute=True):
+            for pair in ["AB", "AD", "BC", "BE", "CF", "FG", "CA"]:
+                self.links[pair] = models.create_alternative({
+                    "drug_id": self.drugs[pair[0]].id,
+                    "alternative_drug_id": self.drugs[pair[1]].id,
+                    "note": pair,
+                })
+
+    def get_substitutes(self, name):
+        return [
+            (item["drug"].name, item["depth"], item["via"].name if item["via"] else None)
+            for item in models.get_in_stock_substitutes(self.drugs[name].id)
+        ]
+
+    def test_nearest_in_stock_substitutes_first(self):
+        # B is out of stock, G is four steps away and the C -> A cycle is
+        # not followed back; one query loads the graph, one checks the stock
+        with self.assertNumQueries(2):
+            substitutes = self.get_substitutes("A")
+        self.assertEqual(substitutes, [("D", 1, None), ("E", 2, "B"), ("C", 2, "B"), ("F", 3, "C")])
+
+    def test_removed_alternative_is_no_longer_followed(self):
+        self.get_substitutes("A")
+        with self.captureOnCommitCallbacks(execute=True):
+            models.delete_alternative_by_id(self.links["AB"].id)
+        self.assertEqual(self.get_substitutes("A"), [("D", 1, None)])
+
+
+class ForecastArrayTests(SimpleTestCase):
+    def test_known_history(self):
+        drug_ids = np.array([1, 2, 3, 5], dtype=np.int64)
+        stock = np.array([10, 0, 40, -2], dtype=np.float64)
+        # drugs 0, 4 and 9 are not in the catalog any more
+        movement_drug_ids = np.array([1, 3, 1, 4, 5, 9, 0], dtype=np.int64)
+        movement_changes = np.array([-20, -5, -10, -100, -10, -7, -1], dtype=np.float64)
+
+        daily_consumption, days_of_supply, reorder_quantity = forecasting.compute_forecast_arrays(
+            drug_ids, stock, movement_drug_ids, movement_changes, window_days=10, cover_days=14
+        )
+
+        np.testing.assert_allclose(daily_consumption, [3.0, 0.0, 0.5, 1.0])
+        np.testing.assert_allclose(days_of_supply, [10 / 3.0, np.nan, 80.0, 0.0])
+        self.assertEqual(reorder_quantity.tolist(), [32, 0, 0, 14])
+
+    def test_no_history(self):
+        daily_consumption, days_of_supply, reorder_quantity = forecasting.compute_forecast_arrays(
+            np.array([1, 2], dtype=np.int64), np.array([3, 0], dtype=np.float64),
+            np.array([], dtype=np.int64), np.array([], dtype=np.float64), window_days=30, cover_days=14
+        )
+        self.assertEqual(daily_consumption.tolist(), [0.0, 0.0])
+        self.assertTrue(np.isnan(days_of_supply).all())
+        self.assertEqual(reorder_quantity.tolist(), [0, 0])
+
+
+@override_settings(CACHES=THROTTLE_SETTINGS["CACHES"])
+class ForecastTests(CatalogMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user()
+        category = self.create_category()
+        self.aspirin = self.create_drug("Aspirin", category, stock="100")
+        self.ibuprofen = self.create_drug("Ibuprofen", category, stock="50")
+
+    def test_only_recent_demand_counts(self):
+        models.dispense_drug_stock(self.aspirin.id, 60)
+        models.receive_drug_stock(self.aspirin.id, 20)
+        models.dispense_drug_stock(self.ibuprofen.id, 30)
+        models.StockMovement.objects.filter(drug_id=self.ibuprofen.id, reason="dispense").update(
+            created_at=timezone.now() - timedelta(days=31)
+        )
+
+        self.assertEqual(forecasting.compute_forecasts(window_days=30, lead_time_days=7, safety_days=8), 2)
+        forecasts = {forecast.drug_id: forecast for forecast in models.DrugForecast.objects.all()}
+        self.assertEqual(forecasts[self.aspirin.id].daily_consumption, 2.0)
+        self.assertEqual(forecasts[self.aspirin.id].days_of_supply, 30.0)
+        self.assertEqual(forecasts[self.aspirin.id].reorder_quantity, 0)
+        self.assertEqual(forecasts[self.ibuprofen.id].daily_consumption, 0.0)
+        self.assertIsNone(forecasts[self.ibuprofen.id].days_of_supply)
+
+        models.dispense_drug_stock(self.aspirin.id, 45)
+        forecasting.compute_forecasts(window_days=30, lead_time_days=7, safety_days=8)
+        suggestions = list(models.get_reorder_suggestions())
+        self.assertEqual([forecast.drug_id for forecast in suggestions], [self.aspirin.id])
+        # 105 dispensed in 30 days covers 15 days at 52.5, 15 are left
+        self.assertEqual(suggestions[0].reorder_quantity, 38)
+
+
+@override_settings(CACHES=THROTTLE_SETTINGS["CACHES"])
+class CatalogExportTests(CatalogMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user()
+        self.log_in(self.user)
+        category = self.create_category()
+        self.drugs = [
+            self.create_drug("Aspirin", category, indications='Pain, fever and "colds"\nSecond line'),
+            self.create_drug("Ibuprofen", category, stock="0"),
+            self.create_drug("Naproxen", category),
+        ]
+
+    def get_export(self, **params):
+        response = self.client.get("/drugs/export/", params)
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_csv_export_follows_the_list_filters(self):
+        response, content = self.get_export(format="csv", in_stock_only="on")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0][:3], ["id", "name", "active_ingredient"])
+        self.assertEqual(rows[0][7:9], ["category_name", "created_by_name"])
+        self.assertEqual([row[1] for row in rows[1:]], ["Aspirin", "Naproxen"])
+        self.assertEqual(rows[1][4], 'Pain, fever and "colds"\nSecond line')
+        self.assertEqual(rows[1][7:9], ["Analgesics", "Admin"])
+
+    def test_ndjson_export(self):
+        response, content = self.get_export(format="ndjson", q="ibuprofen")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = content.splitlines()
+        self.assertEqual(len(lines), 1)
+        item = json.loads(lines[0])
+        self.assertEqual((item["id"], item["name"], item["stock_quantity"]), (self.drugs[1].id, "Ibuprofen", 0))
+        self.assertEqual(item["created_at"], self.drugs[1].created_at.isoformat())
+
+    def test_rows_are_read_in_keyset_chunks(self):
+        qs = models.get_filtered_drugs("", 0, False)
+        with self.assertNumQueries(2):
+            rows = list(models.iter_drug_export_rows(qs, chunk_size=2))
+        self.assertEqual([row[0] for row in rows], [drug.id for drug in self.drugs])
+
+
+@override_settings(CACHES=THROTTLE_SETTINGS["CACHES"])
+class ConditionalPageTests(CatalogMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user()
+        self.log_in(self.user)
+        self.category = self.create_category()
+        self.aspirin = self.create_drug("Aspirin", self.category)
+        self.ibuprofen = self.create_drug("Ibuprofen", self.category)
+        self.urls = ["/drugs/", "/categories/", "/drugs/" + str(self.aspirin.id) + "/"]
+        for url in self.urls:
+            # sets the CSRF cookie the validators depend on
+            self.client.get(url)
+
+    def get_etags(self):
+        etags = []
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etags.append(response["ETag"])
+        return etags
+
+    def test_repeat_request_is_not_modified(self):
+        for url, etag in zip(self.urls, self.get_etags()):
+            # the session, plus the drug's stamp on its details page
+            with self.assertNumQueries(2 if url == self.urls[-1] else 1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], etag)
+            self.assertEqual(response["Cache-Control"], "private, no-cache")
+
+        response = self.client.get(self.urls[-1])
+        response = self.client.get(self.urls[-1], HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_write_changes_the_etag(self):
+        etags = self.get_etags()
+        with self.captureOnCommitCallbacks(execute=True):
+            models.receive_drug_stock(self.aspirin.id, 5)
+        new_etags = self.get_etags()
+        self.assertNotEqual(new_etags[0], etags[0])
+        self.assertNotEqual(new_etags[2], etags[2])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.create_category({"name": "Antibiotics", "description": ""})
+        self.assertNotEqual(self.get_etags()[1], new_etags[1])
+
+        response = self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=etags[0])
+        self.assertContains(response, "Aspirin")
+
+    def test_page_with_messages_is_rendered(self):
+        etag = self.get_etags()[0]
+        self.client.post("/drugs/" + str(self.aspirin.id) + "/stock/dispense/", {"quantity": "0"})
+        response = self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
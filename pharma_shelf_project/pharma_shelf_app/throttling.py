@@ -0,0 +1,171 @@
+import hashlib
+import ipaddress
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import SharedCounters
+
+
+# Failed logins are counted per email and per client IP in buckets of
+# WINDOW / WINDOW_BUCKETS seconds, so each failure is a single incr (atomic
+# only on memcached or Redis, see checks.check_atomic_throttle); the window
+# is the last WINDOW_BUCKETS buckets plus the one that contains its start. Reaching the limit inside the window locks the key out; each
+# further lockout within LOCKOUT_LEVEL_TIMEOUT doubles the lockout time.
+LOCKOUT_LEVEL_TIMEOUT = 24 * 60 * 60
+
+WINDOW_BUCKETS = 10
+
+STAT_NAMES = ["attempts", "failures", "throttled", "lockouts"]
+
+
+def get_limit(scope):
+    if scope == "email":
+        return settings.LOGIN_THROTTLE_EMAIL_LIMIT
+    return settings.LOGIN_THROTTLE_IP_LIMIT
+
+
+def make_key(kind, scope, value):
+    digest = hashlib.md5(value.encode()).hexdigest()
+    return "login_throttle:" + kind + ":" + scope + ":" + digest
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+def is_trusted_proxy(ip):
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    for proxy in settings.TRUSTED_PROXIES:
+        if address in ipaddress.ip_network(proxy, strict=False):
+            return True
+    return False
+
+
+def get_client_ip(request):
+    # Behind trusted proxies the client is the last X-Forwarded-For hop that
+    # no trusted proxy added; anything further left is client-supplied.
+    ip = request.META.get("REMOTE_ADDR", "")
+    if not is_trusted_proxy(ip):
+        return ip
+    hops = [hop.strip() for hop in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")]
+    for hop in reversed(hops):
+        if len(hop) == 0:
+            continue
+        ip = hop
+        if not is_trusted_proxy(hop):
+            break
+    return ip
+
+
+def get_scopes(email, ip):
+    scopes = [("email", normalize_email(email))]
+    if len(ip) > 0:
+        scopes.append(("ip", ip))
+    return scopes
+
+
+stats = SharedCounters("login_throttle")
+
+
+def bump_stat(name):
+    stats.record(name)
+
+
+def get_stats():
+    totals = stats.get_totals()
+    return {name: totals.get(name, 0) for name in STAT_NAMES}
+
+
+def reset_stats():
+    stats.reset()
+
+
+def get_lockout_remaining(email, ip, now=None):
+    if now is None:
+        now = time.time()
+    remaining = 0
+    for scope, value in get_scopes(email, ip):
+        locked_until = cache.get(make_key("lockout", scope, value))
+        if locked_until is not None and locked_until > now:
+            remaining = max(remaining, locked_until - now)
+    return int(remaining + 0.999)
+
+
+def check_login_allowed(email, ip, now=None):
+    bump_stat("attempts")
+    remaining = get_lockout_remaining(email, ip, now)
+    if remaining > 0:
+        bump_stat("throttled")
+    return remaining
+
+
+def get_bucket_keys(scope, value, now):
+    bucket_seconds = settings.LOGIN_THROTTLE_WINDOW_SECONDS / float(WINDOW_BUCKETS)
+    last = int(now // bucket_seconds)
+    prefix = make_key("failures", scope, value)
+    return [prefix + ":" + str(bucket) for bucket in range(last - WINDOW_BUCKETS, last + 1)]
+
+
+def add_failure(key, timeout):
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # evicted between add and incr
+        cache.set(key, 1, timeout)
+        return 1
+
+
+def lock_out(scope, value, now):
+    level_key = make_key("level", scope, value)
+    cache.add(level_key, 0, LOCKOUT_LEVEL_TIMEOUT)
+    try:
+        level = cache.incr(level_key) - 1
+    except ValueError:
+        level = 0
+        cache.set(level_key, 1, LOCKOUT_LEVEL_TIMEOUT)
+    duration = min(
+        settings.LOGIN_LOCKOUT_BASE_SECONDS * (2 ** level),
+        settings.LOGIN_LOCKOUT_MAX_SECONDS
+    )
+    cache.set(make_key("lockout", scope, value), now + duration, duration)
+    cache.delete_many(get_bucket_keys(scope, value, now))
+    bump_stat("lockouts")
+
+
+def record_failure(email, ip, now=None):
+    if now is None:
+        now = time.time()
+    # buckets outlive the window so the oldest one is still there to count
+    timeout = settings.LOGIN_THROTTLE_WINDOW_SECONDS * 2
+    bump_stat("failures")
+
+    for scope, value in get_scopes(email, ip):
+        keys = get_bucket_keys(scope, value, now)
+        add_failure(keys[-1], timeout)
+        counts = cache.get_many(keys)
+        if sum(counts.values()) < get_limit(scope):
+            continue
+        # of concurrent failures past the limit only one locks out
+        guard_key = make_key("locking", scope, value)
+        if cache.add(guard_key, 1, 10):
+            try:
+                locked_until = cache.get(make_key("lockout", scope, value))
+                if locked_until is None or locked_until <= now:
+                    lock_out(scope, value, now)
+            finally:
+                cache.delete(guard_key)
+
+
+def record_success(email, ip, now=None):
+    # A correct password clears the email's history. The IP keeps its
+    # failures, since one valid account must not reset a stuffing run.
+    if now is None:
+        now = time.time()
+    email = normalize_email(email)
+    cache.delete_many(get_bucket_keys("email", email, now) + [make_key("level", "email", email)])
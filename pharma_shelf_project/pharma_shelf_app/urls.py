@@ -11,16 +11,23 @@ urlpatterns = [
    
     path("drugs/", views.drugs_list, name="drugs"),
     path("drugs/add/", views.add_drug, name="add_drug"),
+    path("drugs/typeahead/", views.drug_typeahead, name="drug_typeahead"),
+    path("drugs/stock/bulk/", views.bulk_update_stock, name="bulk_update_stock"),
+    path("drugs/import/", views.import_catalog, name="import_catalog"),
+    path("drugs/export/", views.export_catalog, name="export_catalog"),
     path("drugs/<int:drug_id>/", views.drug_details, name="drug_details"),
     path("drugs/<int:drug_id>/alternatives/add/", views.add_alternative, name="add_alternative"),
     path("drugs/<int:drug_id>/alternatives/<int:alt_id>/remove/", views.remove_alternative, name="remove_alternative"),
     path("drugs/<int:drug_id>/edit/", views.edit_drug, name="edit_drug"),
     path("drugs/<int:drug_id>/stock/update/", views.update_drug_stock, name="update_drug_stock"),
+    path("drugs/<int:drug_id>/stock/dispense/", views.dispense_drug, name="dispense_drug"),
+    path("drugs/<int:drug_id>/stock/receive/", views.receive_drug, name="receive_drug"),
     
     path("categories/", views.categories_list, name="categories"),
     path("categories/add/", views.add_category, name="add_category"),
     
     path("interactions/check/", views.interaction_checker, name="interaction_checker"),
+    path("interactions/check/json/", views.interaction_checker_json, name="interaction_checker_json"),
     path("interactions/add/", views.add_interaction, name="add_interaction"),
 
     path("users/", views.user_management, name="user_management"),
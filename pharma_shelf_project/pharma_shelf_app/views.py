@@ -1,182 +1,182 @@
 from django.shortcuts import render, redirect
+from django.http import JsonResponse, StreamingHttpResponse
 from django.contrib import messages
-from . import models
-import bcrypt
+from . import catalog_import, conditional, db_connections, fragments, models, passwords, throttling
+from asgiref.sync import sync_to_async
+from django.db.models import QuerySet
+import asyncio
 
 
-from django.conf import settings
-from django.template.loader import render_to_string
 from django.urls import reverse
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-from python_http_client.exceptions import HTTPError
 
 
 from math import ceil
+import csv
+import io
+import json
 
 
-def login(request):
-    if "user_id" in request.session:
+# login, signup and profile are async so the bcrypt work runs in the
+# passwords executor instead of holding a server worker. Session and ORM
+# access stay synchronous and go through sync_to_async.
+def get_session_user_id(request):
+    return request.session.get("user_id")
+
+
+def start_session(request, user_id):
+    request.session["user_id"] = user_id
+
+
+def get_first_user_by_email(email):
+    users = list(models.get_user_by_email(email))
+    if len(users) == 0:
+        return None
+    return users[0]
+
+
+async def login(request):
+    if await sync_to_async(get_session_user_id)(request) is not None:
         return redirect("/dashboard")
 
     if request.method == "POST":
-        users = models.get_user_by_email(request.POST["email"])
-        if len(users) == 0:
-            messages.error(request, "Invalid email or password.")
+        email = request.POST["email"]
+        ip = throttling.get_client_ip(request)
+        remaining = await sync_to_async(throttling.check_login_allowed)(email, ip)
+        if remaining > 0:
+            messages.error(request, "Too many failed login attempts. Try again in " + str(remaining) + " seconds.")
             return redirect("/login")
 
-        user = users[0]
+        user = await sync_to_async(get_first_user_by_email)(email)
+        if user is None:
+            await sync_to_async(throttling.record_failure)(email, ip)
+            messages.error(request, "Invalid email or password.")
+            return redirect("/login")
 
-        if not bcrypt.checkpw(request.POST["password"].encode(), user.password_hash.encode()):
+        password = request.POST["password"]
+        if not await passwords.acheck_password(password, user.password_hash):
+            await sync_to_async(throttling.record_failure)(email, ip)
             messages.error(request, "Invalid email or password.")
             return redirect("/login")
+
+        await sync_to_async(throttling.record_success)(email, ip)
         
         if not user.is_active:
             messages.error(request, "Your account is disabled. Please contact the administrator.")
             return redirect("login")
+
+        if passwords.needs_rehash(user.password_hash):
+            pw_hash = await passwords.ahash_password(password)
+            await sync_to_async(models.set_user_password_hash)(user.id, pw_hash)
         
-        request.session["user_id"] = user.id
+        await sync_to_async(start_session)(request, user.id)
         return redirect("/dashboard")
 
-    return render(request, "login.html")
+    return await sync_to_async(render)(request, "login.html")
 
 
-def signup(request):
-    if "user_id" in request.session:
+async def signup(request):
+    if await sync_to_async(get_session_user_id)(request) is not None:
         return redirect("/dashboard")
 
     if request.method == "POST":
-        errors = models.User.objects.validate_user_registration(request.POST)
+        errors = await sync_to_async(models.User.objects.validate_user_registration)(request.POST)
         if len(errors) > 0:
             for key in errors:
                 messages.error(request, errors[key])
             return redirect("/signup")
 
-        password = request.POST["password"]
-        pw_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+        pw_hash = await passwords.ahash_password(request.POST["password"])
 
-        user = models.create_user(request.POST, pw_hash)
+        user = await sync_to_async(models.create_user)(request.POST, pw_hash)
 
-        request.session["user_id"] = user.id
+        await sync_to_async(start_session)(request, user.id)
         return redirect("/dashboard")
 
-    return render(request, "signup.html")
+    return await sync_to_async(render)(request, "signup.html")
 
 
 
 
 
+def get_low_stock_drugs(threshold=5):
+    low_stock_drugs = models.Drug.objects.filter(
+        stock_quantity__gt=0,
+        stock_quantity__lte=threshold
+    ).select_related("category").order_by("stock_quantity", "name")
+    return low_stock_drugs
+
+
 def dashboard(request):
     if "user_id" not in request.session:
         return redirect("login")
 
-    current_user = models.get_current_user(request.session["user_id"])
+    current_user = request.current_user
+    # read before any catalog query, so a fragment can never be cached
+    # with data older than its version
+    fragment_versions = fragments.get_fragment_versions()
 
-    total_drugs = models.Drug.objects.count()
-    in_stock_drugs = models.Drug.objects.filter(stock_quantity__gt=0).count()
-    out_of_stock_drugs = models.Drug.objects.filter(stock_quantity=0).count()
-    total_categories = models.Category.objects.count()
-    total_interactions = models.DrugInteraction.objects.count()
+    low_stock_drugs = get_low_stock_drugs()
+    reorder_suggestions = models.get_reorder_suggestions()
 
-    low_stock_threshold = 5
-    low_stock_drugs = models.Drug.objects.filter(
-        stock_quantity__gt=0,
-        stock_quantity__lte=low_stock_threshold
-    ).select_related("category").order_by("stock_quantity", "name")
+    context = {
+        "current_user": current_user,
+        "fragments": fragment_versions,
+        "low_stock_drugs": low_stock_drugs,
+        "catalog_stats": fragments.lazy(models.get_catalog_stats),
+        "reorder_suggestions": reorder_suggestions,
+    }
+    context.update(models.get_user_stats(current_user.role == "admin"))
 
-    categories = models.get_all_categories()
-    categories_stats = []
-    for category in categories:
-        count = models.Drug.objects.filter(category=category).count()
-        categories_stats.append(
-            {
-                "category": category,
-                "drug_count": count,
-            }
-        )
+    return render(request, "dashboard.html", context)
 
-    top_categories_stats = []
-    if categories_stats:
-        total_for_percent = 0
-        for item in categories_stats:
-            total_for_percent += item["drug_count"]
 
-        sorted_categories = sorted(
-            categories_stats,
-            key=lambda x: x["drug_count"],
-            reverse=True
-        )
-        sorted_categories = sorted_categories[:5]
-
-        for item in sorted_categories:
-            percentage = 0
-            if total_for_percent > 0:
-                percentage = round((item["drug_count"] * 100.0) / total_for_percent)
-            top_categories_stats.append(
-                {
-                    "category": item["category"],
-                    "drug_count": item["drug_count"],
-                    "percentage": percentage,
-                }
-            )
-
-    categories_chart_labels = []
-    categories_chart_counts = []
-    if categories_stats:
-        sorted_for_chart = sorted(
-            categories_stats,
-            key=lambda x: x["drug_count"],
-            reverse=True
-        )
-        top_for_chart = sorted_for_chart[:5]
-        others_for_chart = sorted_for_chart[5:]
-
-        other_count = 0
-        for item in others_for_chart:
-            other_count += item["drug_count"]
-
-        for item in top_for_chart:
-            categories_chart_labels.append(item["category"].name)
-            categories_chart_counts.append(item["drug_count"])
-
-        if other_count > 0:
-            categories_chart_labels.append("Other")
-            categories_chart_counts.append(other_count)
-
-    users_total = 0
-    users_active = 0
-    users_disabled = 0
-    admins_count = 0
-    pharmacists_count = 0
-
-    if current_user.role == "admin":
-        users_qs = models.User.objects.all()
-        users_total = users_qs.count()
-        users_active = users_qs.filter(is_active=True).count()
-        users_disabled = users_qs.filter(is_active=False).count()
-        admins_count = users_qs.filter(role="admin").count()
-        pharmacists_count = users_qs.filter(role="pharmacist").count()
+# Async versions of the read-heavy pages, kept for benchmark_read_views and
+# not routed: measured against the sync views on a threaded WSGI server they
+# serve about half the requests per second. Django 3.2 has no async ORM, so
+# each independent query runs on a thread (and database connection) of the
+# db_connections pool and the queries of one page are awaited together with
+# asyncio.gather; the hops cost more than the overlap saves.
+def run_query(func, *args):
+    def call():
+        result = func(*args)
+        if isinstance(result, QuerySet):
+            result = list(result)
+        return result
+    return db_connections.run_in_pool(call)
+
+
+def load_current_user(request):
+    current_user = request.current_user
+    # reading any field loads the lazy snapshot in this thread
+    current_user.id
+    return current_user
+
+
+async def async_dashboard(request):
+    if request.current_user is None:
+        return redirect("login")
+
+    fragment_versions = await run_query(fragments.get_fragment_versions)
+
+    current_user = await run_query(load_current_user, request)
+
+    low_stock_drugs, catalog_stats, user_stats, reorder_suggestions = await asyncio.gather(
+        run_query(get_low_stock_drugs),
+        run_query(models.get_catalog_stats),
+        run_query(models.get_user_stats, current_user.role == "admin"),
+        run_query(models.get_reorder_suggestions),
+    )
 
     context = {
         "current_user": current_user,
-        "total_drugs": total_drugs,
-        "in_stock_drugs": in_stock_drugs,
-        "out_of_stock_drugs": out_of_stock_drugs,
-        "total_categories": total_categories,
-        "total_interactions": total_interactions,
+        "fragments": fragment_versions,
         "low_stock_drugs": low_stock_drugs,
-        "categories_stats": categories_stats,
-        "top_categories_stats": top_categories_stats,
-        "categories_chart_labels": categories_chart_labels,
-        "categories_chart_counts": categories_chart_counts,
-        "users_total": users_total,
-        "users_active": users_active,
-        "users_disabled": users_disabled,
-        "admins_count": admins_count,
-        "pharmacists_count": pharmacists_count,
+        "catalog_stats": catalog_stats,
+        "reorder_suggestions": reorder_suggestions,
     }
+    context.update(user_stats)
 
-    return render(request, "dashboard.html", context)
+    return await sync_to_async(render)(request, "dashboard.html", context)
 
 
 
@@ -190,7 +190,7 @@ def add_drug(request):
     if "user_id" not in request.session:
         return redirect("login")
 
-    current_user = models.get_current_user(request.session["user_id"])
+    current_user = request.current_user
     if current_user.role != "admin":
         return redirect("drugs")
     
@@ -216,13 +216,7 @@ def add_drug(request):
 
 
 
-def drugs_list(request):
-    if "user_id" not in request.session:
-        return redirect("login")
-
-    current_user = models.get_current_user(request.session["user_id"])
-    categories = models.get_all_categories()
-
+def get_drug_list_filters(request):
     search_query = ""
     selected_category_id = 0
     in_stock_only = False
@@ -231,15 +225,19 @@ def drugs_list(request):
         search_query = request.GET["q"]
 
     if "category_id" in request.GET:
-        if len(request.GET["category_id"]) > 0:
+        # a malformed id shows every category rather than failing the page
+        try:
             selected_category_id = int(request.GET["category_id"])
+        except ValueError:
+            selected_category_id = 0
 
     if "in_stock_only" in request.GET:
         in_stock_only = request.GET["in_stock_only"] == "on"
 
-    qs = models.get_filtered_drugs(search_query, selected_category_id, in_stock_only)
+    return search_query, selected_category_id, in_stock_only
+
 
-    page_size = 5
+def get_requested_page(request):
     page_param = "1"
     if "page" in request.GET:
         page_param = request.GET["page"]
@@ -251,6 +249,60 @@ def drugs_list(request):
 
     if page < 1:
         page = 1
+    return page
+
+
+def get_request_cursor(request):
+    cursor = ""
+    if "cursor" in request.GET:
+        cursor = request.GET["cursor"]
+    return cursor
+
+
+DRUGS_PAGE_SIZE = 5
+
+
+def drugs_list(request):
+    if "user_id" not in request.session:
+        return redirect("login")
+
+    current_user = request.current_user
+    fragment_versions = fragments.get_fragment_versions()
+
+    etag, last_modified = conditional.get_drugs_list_validators(request, current_user, fragment_versions)
+    not_modified = conditional.get_not_modified_response(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    categories = models.get_all_categories()
+
+    filters = get_drug_list_filters(request)
+    search_query, selected_category_id, in_stock_only = filters
+    page_size = DRUGS_PAGE_SIZE
+
+    context = {
+        "current_user": current_user,
+        "fragments": fragment_versions,
+        "categories": categories,
+        "search_query": search_query,
+        "selected_category_id": selected_category_id,
+        "in_stock_only": in_stock_only,
+    }
+    # the rows and the pagination are both cached fragments
+    if "paging" in request.GET and request.GET["paging"] == "cursor":
+        cursor = get_request_cursor(request)
+        context["cursor_mode"] = True
+        context["listing"] = fragments.lazy(get_drugs_cursor_listing, filters, cursor, page_size)
+    else:
+        page = get_requested_page(request)
+        context["listing"] = fragments.lazy(get_drugs_offset_listing, filters, page, page_size)
+
+    response = render(request, "drugs.html", context)
+    return conditional.set_validators(response, etag, last_modified)
+
+
+def get_drugs_offset_listing(filters, page, page_size):
+    qs = models.get_filtered_drugs(*filters)
 
     total_count = qs.count()
     total_pages = ceil(total_count / page_size) if total_count > 0 else 1
@@ -258,47 +310,190 @@ def drugs_list(request):
     if page > total_pages:
         page = total_pages
 
-    page_numbers = range(1, total_pages + 1)
-
     offset = (page - 1) * page_size
     limit = offset + page_size
 
-    drugs = qs[offset:limit]
+    return get_offset_listing(qs[offset:limit], page, total_pages)
+
+
+def get_offset_listing(drugs, page, total_pages):
+    return {
+        "drugs": drugs,
+        "page": page,
+        "total_pages": total_pages,
+        "has_previous": page > 1,
+        "has_next": page < total_pages,
+        "page_numbers": range(1, total_pages + 1),
+    }
 
-    has_previous = page > 1
-    has_next = page < total_pages
+
+def get_drugs_cursor_listing(filters, cursor, page_size):
+    qs = models.get_filtered_drugs(*filters)
+    drugs, next_cursor, previous_cursor = models.get_drugs_page_by_cursor(qs, cursor, page_size)
+    return get_cursor_listing(drugs, next_cursor, previous_cursor, models.get_estimated_drug_count(qs, *filters))
+
+
+def get_cursor_listing(drugs, next_cursor, previous_cursor, estimated_count):
+    return {
+        "drugs": drugs,
+        "next_cursor": next_cursor,
+        "previous_cursor": previous_cursor,
+        "estimated_count": estimated_count,
+    }
+
+
+def load_drugs_count(filters):
+    return models.get_filtered_drugs(*filters).count()
+
+
+def load_drugs_offset_page(filters, page, page_size):
+    offset = (page - 1) * page_size
+    return list(models.get_filtered_drugs(*filters)[offset:offset + page_size])
+
+
+def load_drugs_cursor_page(filters, cursor, page_size):
+    qs = models.get_filtered_drugs(*filters)
+    return models.get_drugs_page_by_cursor(qs, cursor, page_size)
+
+
+def load_estimated_drug_count(filters):
+    qs = models.get_filtered_drugs(*filters)
+    return models.get_estimated_drug_count(qs, *filters)
+
+
+async def async_drugs_list(request):
+    if request.current_user is None:
+        return redirect("login")
+
+    filters = get_drug_list_filters(request)
+    search_query, selected_category_id, in_stock_only = filters
+    page_size = DRUGS_PAGE_SIZE
+    fragment_versions = await run_query(fragments.get_fragment_versions)
+    current_user = await run_query(load_current_user, request)
+
+    etag, last_modified = await run_query(conditional.get_drugs_list_validators, request, current_user, fragment_versions)
+    not_modified = await sync_to_async(conditional.get_not_modified_response)(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    if "paging" in request.GET and request.GET["paging"] == "cursor":
+        cursor = get_request_cursor(request)
+
+        categories, cursor_page, estimated_count = await asyncio.gather(
+            run_query(models.get_all_categories),
+            run_query(load_drugs_cursor_page, filters, cursor, page_size),
+            run_query(load_estimated_drug_count, filters),
+        )
+        drugs, next_cursor, previous_cursor = cursor_page
+
+        context = {
+            "current_user": current_user,
+            "fragments": fragment_versions,
+            "categories": categories,
+            "search_query": search_query,
+            "selected_category_id": selected_category_id,
+            "in_stock_only": in_stock_only,
+            "cursor_mode": True,
+            "listing": get_cursor_listing(drugs, next_cursor, previous_cursor, estimated_count),
+        }
+        response = await sync_to_async(render)(request, "drugs.html", context)
+        return conditional.set_validators(response, etag, last_modified)
+
+    page = get_requested_page(request)
+
+    # the page is fetched together with the count; only a page past the end
+    # needs a second round trip once the real number of pages is known
+    categories, total_count, drugs = await asyncio.gather(
+        run_query(models.get_all_categories),
+        run_query(load_drugs_count, filters),
+        run_query(load_drugs_offset_page, filters, page, page_size),
+    )
+    total_pages = ceil(total_count / page_size) if total_count > 0 else 1
+
+    if page > total_pages:
+        page = total_pages
+        drugs = await run_query(load_drugs_offset_page, filters, page, page_size)
 
     context = {
         "current_user": current_user,
+        "fragments": fragment_versions,
         "categories": categories,
-        "drugs": drugs,
         "search_query": search_query,
         "selected_category_id": selected_category_id,
         "in_stock_only": in_stock_only,
-        "page": page,
-        "total_pages": total_pages,
-        "has_previous": has_previous,
-        "has_next": has_next,
-        "page_numbers": page_numbers,
+        "listing": get_offset_listing(drugs, page, total_pages),
     }
-    return render(request, "drugs.html", context)
+    response = await sync_to_async(render)(request, "drugs.html", context)
+    return conditional.set_validators(response, etag, last_modified)
+
+
+
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def export_catalog(request):
+    if "user_id" not in request.session:
+        return redirect("login")
+
+    search_query, selected_category_id, in_stock_only = get_drug_list_filters(request)
 
+    file_format = "csv"
+    if "format" in request.GET and request.GET["format"] == "ndjson":
+        file_format = "ndjson"
+
+    qs = models.get_filtered_drugs(search_query, selected_category_id, in_stock_only)
+    rows = models.iter_drug_export_rows(qs)
+    columns = [field.replace("__", "_") for field in models.EXPORT_FIELDS]
 
+    if file_format == "ndjson":
+        def generate_ndjson():
+            for row in rows:
+                item = dict(zip(columns, row))
+                item["created_at"] = item["created_at"].isoformat()
+                item["updated_at"] = item["updated_at"].isoformat()
+                yield json.dumps(item) + "\n"
 
+        response = StreamingHttpResponse(generate_ndjson(), content_type="application/x-ndjson")
+        response["Content-Disposition"] = 'attachment; filename="pharmashelf_catalog.ndjson"'
+        return response
+
+    writer = csv.writer(Echo())
+
+    def generate_csv():
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(generate_csv(), content_type="text/csv")
+    response["Content-Disposition"] = 'attachment; filename="pharmashelf_catalog.csv"'
+    return response
 
 
 def categories_list(request):
     if "user_id" not in request.session:
         return redirect("login")
 
-    current_user = models.get_current_user(request.session["user_id"])
+    current_user = request.current_user
+    fragment_versions = fragments.get_fragment_versions()
+
+    etag, last_modified = conditional.get_categories_validators(request, current_user, fragment_versions)
+    not_modified = conditional.get_not_modified_response(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
     categories = models.get_all_categories()
 
     context = {
         "current_user": current_user,
+        "fragments": fragment_versions,
         "categories": categories
     }
-    return render(request, "categories.html", context)
+    response = render(request, "categories.html", context)
+    return conditional.set_validators(response, etag, last_modified)
 
 
 def add_category(request):
@@ -321,18 +516,64 @@ def drug_details(request, drug_id):
     if "user_id" not in request.session:
         return redirect("login")
 
-    current_user = models.get_current_user(request.session["user_id"])
+    current_user = request.current_user
+    fragment_versions = fragments.get_fragment_versions()
+
+    etag, last_modified = conditional.get_drug_details_validators(request, current_user, fragment_versions, drug_id)
+    not_modified = conditional.get_not_modified_response(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
     selected_drug = models.get_drug_by_id(drug_id)
     alternatives = models.get_alternatives_for_drug(drug_id)
-    all_drugs = models.get_all_drugs()
+
+    substitutes = []
+    if selected_drug.stock_quantity <= 0:
+        substitutes = fragments.lazy(models.get_in_stock_substitutes, drug_id)
+
+    context = {
+        "current_user": current_user,
+        "fragments": fragment_versions,
+        "selected_drug": selected_drug,
+        "alternatives": alternatives,
+        "substitutes": substitutes,
+    }
+    response = render(request, "drug_details.html", context)
+    return conditional.set_validators(response, etag, last_modified)
+
+
+async def async_drug_details(request, drug_id):
+    if request.current_user is None:
+        return redirect("login")
+
+    fragment_versions = await run_query(fragments.get_fragment_versions)
+    current_user = await run_query(load_current_user, request)
+
+    etag, last_modified = await run_query(
+        conditional.get_drug_details_validators, request, current_user, fragment_versions, drug_id
+    )
+    not_modified = await sync_to_async(conditional.get_not_modified_response)(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    selected_drug, alternatives = await asyncio.gather(
+        run_query(models.get_drug_by_id, drug_id),
+        run_query(models.get_alternatives_for_drug, drug_id),
+    )
+
+    substitutes = []
+    if selected_drug.stock_quantity <= 0:
+        substitutes = await run_query(models.get_in_stock_substitutes, drug_id)
 
     context = {
         "current_user": current_user,
+        "fragments": fragment_versions,
         "selected_drug": selected_drug,
         "alternatives": alternatives,
-        "all_drugs": all_drugs
+        "substitutes": substitutes,
     }
-    return render(request, "drug_details.html", context)
+    response = await sync_to_async(render)(request, "drug_details.html", context)
+    return conditional.set_validators(response, etag, last_modified)
 
 def add_alternative(request, drug_id):
     if "user_id" not in request.session:
@@ -359,36 +600,177 @@ def remove_alternative(request, drug_id, alt_id):
     messages.success(request, "Alternative removed successfully.")
     return redirect("drug_details", drug_id=drug_id)
 
-def interaction_checker(request):
-    if "user_id" not in request.session:
-        return redirect("login")
+MAX_REGIMEN_DRUGS = 50
+
+
+def parse_drug_ids(values):
+    drug_ids = []
+    for value in values:
+        for part in value.split(","):
+            part = part.strip()
+            if len(part) == 0:
+                continue
+            try:
+                drug_id = int(part)
+            except ValueError:
+                continue
+            if drug_id not in drug_ids:
+                drug_ids.append(drug_id)
+    return drug_ids
+
+
+def get_regimen_size_error(drug_ids):
+    # a partial check would report the regimen as safe, so none is run
+    if len(drug_ids) > MAX_REGIMEN_DRUGS:
+        return (
+            "A regimen can have at most " + str(MAX_REGIMEN_DRUGS) + " drugs; " + str(len(drug_ids))
+            + " were selected. Remove some drugs and check again."
+        )
+    return None
 
-    current_user = models.get_current_user(request.session["user_id"])
-    all_drugs = models.get_all_drugs()
 
+def get_interaction_check(request):
     selected_drug_a_id = 0
     selected_drug_b_id = 0
-    interactions = []
+    selected_drug_ids = []
     has_checked = False
+    error = None
 
     if "drug_a_id" in request.GET and "drug_b_id" in request.GET:
         if len(request.GET["drug_a_id"]) > 0 and len(request.GET["drug_b_id"]) > 0:
-            selected_drug_a_id = int(request.GET["drug_a_id"])
-            selected_drug_b_id = int(request.GET["drug_b_id"])
+            try:
+                selected_drug_a_id = int(request.GET["drug_a_id"])
+                selected_drug_b_id = int(request.GET["drug_b_id"])
+                has_checked = True
+            except ValueError:
+                selected_drug_a_id = 0
+                selected_drug_b_id = 0
+                error = "Select both drugs from the suggestions."
+    elif "drug_ids" in request.GET:
+        selected_drug_ids = parse_drug_ids(request.GET.getlist("drug_ids"))
+        error = get_regimen_size_error(selected_drug_ids)
+        if error is None and len(selected_drug_ids) > 1:
             has_checked = True
-            interactions = models.get_interactions_between(selected_drug_a_id, selected_drug_b_id)
+
+    return selected_drug_a_id, selected_drug_b_id, selected_drug_ids, has_checked, error
+
+
+def load_checked_interactions(selected_drug_a_id, selected_drug_b_id, selected_drug_ids):
+    if len(selected_drug_ids) > 0:
+        return models.get_interactions_for_regimen(selected_drug_ids)
+    return models.get_interactions_between(selected_drug_a_id, selected_drug_b_id)
+
+
+def get_interaction_checker_context(current_user, check, interactions, drugs):
+    selected_drug_a_id, selected_drug_b_id, selected_drug_ids, has_checked, error = check
+
+    # only the selected drugs are loaded, to pre-fill the drug pickers
+    selected_drugs = {}
+    for drug in drugs:
+        selected_drugs[drug.id] = drug
 
     context = {
         "current_user": current_user,
-        "all_drugs": all_drugs,
-        "selected_drug_a_id": selected_drug_a_id,
-        "selected_drug_b_id": selected_drug_b_id,
+        "selected_drug_a": selected_drugs.get(selected_drug_a_id),
+        "selected_drug_b": selected_drugs.get(selected_drug_b_id),
+        "regimen_drugs": [selected_drugs[drug_id] for drug_id in selected_drug_ids if drug_id in selected_drugs],
         "interactions": interactions,
         "has_checked": has_checked,
+        "check_error": error,
     }
+    return context
+
+
+def interaction_checker(request):
+    if "user_id" not in request.session:
+        return redirect("login")
+
+    current_user = request.current_user
+
+    check = get_interaction_check(request)
+    selected_drug_a_id, selected_drug_b_id, selected_drug_ids, has_checked, error = check
+
+    interactions = []
+    if has_checked:
+        interactions = load_checked_interactions(selected_drug_a_id, selected_drug_b_id, selected_drug_ids)
+    drugs = models.get_drugs_by_ids([selected_drug_a_id, selected_drug_b_id] + selected_drug_ids)
+
+    context = get_interaction_checker_context(current_user, check, interactions, drugs)
     return render(request, "interaction_checker.html", context)
 
 
+async def no_interactions():
+    return []
+
+
+async def async_interaction_checker(request):
+    if request.current_user is None:
+        return redirect("login")
+
+    check = get_interaction_check(request)
+    selected_drug_a_id, selected_drug_b_id, selected_drug_ids, has_checked, error = check
+
+    if has_checked:
+        interactions_query = run_query(load_checked_interactions, selected_drug_a_id, selected_drug_b_id, selected_drug_ids)
+    else:
+        interactions_query = no_interactions()
+
+    current_user, interactions, drugs = await asyncio.gather(
+        run_query(load_current_user, request),
+        interactions_query,
+        run_query(models.get_drugs_by_ids, [selected_drug_a_id, selected_drug_b_id] + selected_drug_ids),
+    )
+
+    context = get_interaction_checker_context(current_user, check, interactions, drugs)
+    return await sync_to_async(render)(request, "interaction_checker.html", context)
+
+
+def drug_typeahead(request):
+    if "user_id" not in request.session:
+        return JsonResponse({"error": "Authentication required."}, status=401)
+
+    query = ""
+    if "q" in request.GET:
+        query = request.GET["q"]
+
+    limit = 10
+    if "limit" in request.GET:
+        try:
+            limit = int(request.GET["limit"])
+        except ValueError:
+            limit = 10
+    limit = max(1, min(limit, 20))
+
+    return JsonResponse({"results": models.get_drug_suggestions(query, limit)})
+
+
+def interaction_checker_json(request):
+    if "user_id" not in request.session:
+        return JsonResponse({"error": "Authentication required."}, status=401)
+
+    drug_ids = parse_drug_ids(request.GET.getlist("drug_ids"))
+    if len(drug_ids) < 2:
+        return JsonResponse({"error": "Select at least two drugs."}, status=400)
+    error = get_regimen_size_error(drug_ids)
+    if error is not None:
+        return JsonResponse({"error": error}, status=400)
+
+    interactions = models.get_interactions_for_regimen(drug_ids)
+
+    results = []
+    for interaction in interactions:
+        results.append(
+            {
+                "drug_a": {"id": interaction.drug_a_id, "name": interaction.drug_a.name},
+                "drug_b": {"id": interaction.drug_b_id, "name": interaction.drug_b.name},
+                "severity": interaction.severity,
+                "description": interaction.description,
+            }
+        )
+
+    return JsonResponse({"drug_ids": drug_ids, "interactions": results})
+
+
 def add_interaction(request):
     if "user_id" not in request.session:
         return redirect("login")
@@ -403,12 +785,10 @@ def add_interaction(request):
         models.create_interaction(request.POST)
         return redirect("interaction_checker")
 
-    current_user = models.get_current_user(request.session["user_id"])
-    all_drugs = models.get_all_drugs()
+    current_user = request.current_user
 
     context = {
         "current_user": current_user,
-        "all_drugs": all_drugs
     }
     return render(request, "add_interaction.html", context)
 
@@ -430,44 +810,188 @@ def update_drug_stock(request, drug_id):
     new_stock = int(request.POST["stock_quantity"])
     drug = models.update_drug_stock(drug_id, new_stock)
 
-    if new_stock == 0 and settings.SENDGRID_API_KEY is not None:
-        admin_emails = models.get_admin_emails()
-        if len(admin_emails) > 0:
-            subject = "Drug out of stock: " + drug.name
-            plain_text = "The following drug is now out of stock: " + drug.name
-            app_url = request.build_absolute_uri(reverse("drugs"))
-            html_content = render_to_string(
-                "emails/out_of_stock.html",
-                {
-                    "drug": drug,
-                    "app_url": app_url
-                }
-            )
-            try:
-                print(settings.SENDGRID_API_KEY)
-                sg = SendGridAPIClient(settings.SENDGRID_API_KEY)
-                message = Mail(
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    to_emails=admin_emails,
-                    subject=subject,
-                    plain_text_content=plain_text,
-                    html_content=html_content,
-                )
-                sg.send(message)
-            except HTTPError as e:
-                print("SendGrid HTTPError status:", e.status_code)
-                print("SendGrid body:", e.body)
-            except Exception as e:
-                print("Error sending email:", e)
+    if new_stock == 0:
+        # sent by the send_notifications worker, off the request path
+        app_url = request.build_absolute_uri(reverse("drugs"))
+        models.enqueue_out_of_stock_notification(drug, app_url)
     messages.success(request, "Stock value was updated successfully.")
     return redirect("drug_details", drug_id=drug_id)
 
 
+def dispense_drug(request, drug_id):
+    if "user_id" not in request.session:
+        return redirect("login")
+
+    if request.method != "POST":
+        return redirect("drug_details", drug_id=drug_id)
+
+    errors = models.Drug.objects.validate_stock_movement(request.POST)
+    if len(errors) > 0:
+        for key in errors:
+            messages.error(request, errors[key])
+        return redirect("drug_details", drug_id=drug_id)
+
+    quantity = int(request.POST["quantity"])
+    result = models.dispense_drug_stock(drug_id, quantity)
+
+    if result == "not_found":
+        messages.error(request, "Drug not found.")
+        return redirect("drugs")
+
+    if result == "insufficient":
+        messages.error(request, "Not enough stock to dispense " + str(quantity) + " units.")
+        return redirect("drug_details", drug_id=drug_id)
+
+    if result == "out_of_stock":
+        drug = models.get_drug_by_id(drug_id)
+        app_url = request.build_absolute_uri(reverse("drugs"))
+        models.enqueue_out_of_stock_notification(drug, app_url)
+
+    messages.success(request, "Dispensed " + str(quantity) + " units.")
+    return redirect("drug_details", drug_id=drug_id)
+
+
+def receive_drug(request, drug_id):
+    if "user_id" not in request.session:
+        return redirect("login")
+
+    if request.method != "POST":
+        return redirect("drug_details", drug_id=drug_id)
+
+    errors = models.Drug.objects.validate_stock_movement(request.POST)
+    if len(errors) > 0:
+        for key in errors:
+            messages.error(request, errors[key])
+        return redirect("drug_details", drug_id=drug_id)
+
+    quantity = int(request.POST["quantity"])
+    result = models.receive_drug_stock(drug_id, quantity)
+
+    if result == "not_found":
+        messages.error(request, "Drug not found.")
+        return redirect("drugs")
+
+    if result == "too_large":
+        messages.error(request, "Receiving " + str(quantity) + " units would exceed the largest stock quantity.")
+        return redirect("drug_details", drug_id=drug_id)
+
+    messages.success(request, "Received " + str(quantity) + " units.")
+    return redirect("drug_details", drug_id=drug_id)
+
+
+def parse_stock_entries(text):
+    entries = []
+    errors = []
+    reader = csv.reader(io.StringIO(text))
+    line_number = 0
+    for row in reader:
+        line_number += 1
+        row = [value.strip() for value in row]
+        if len(row) == 0 or (len(row) == 1 and len(row[0]) == 0):
+            continue
+        if line_number == 1 and not row[0].isdigit():
+            # header row such as "drug_id,quantity"
+            continue
+        if len(row) != 2 or not row[0].isdigit():
+            errors.append("Line " + str(line_number) + ": expected drug_id,quantity.")
+            continue
+        entries.append((int(row[0]), row[1]))
+    return entries, errors
+
+
+def bulk_update_stock(request):
+    if "user_id" not in request.session:
+        return redirect("login")
+
+    current_user = request.current_user
+    if current_user.role != "admin":
+        return redirect("drugs")
+
+    if request.method == "POST":
+        text = request.POST.get("entries", "")
+        entries = []
+        errors = []
+        if "csv_file" in request.FILES:
+            try:
+                text = request.FILES["csv_file"].read().decode("utf-8-sig")
+            except UnicodeDecodeError:
+                text = ""
+                errors.append("The uploaded file must be UTF-8 encoded text.")
+
+        if len(errors) == 0:
+            entries, errors = parse_stock_entries(text)
+        if len(errors) == 0 and len(entries) == 0:
+            errors.append("Enter at least one drug_id,quantity pair.")
+
+        if len(errors) == 0:
+            stock_errors, out_of_stock = models.bulk_update_drug_stock(entries)
+            for drug_id in stock_errors:
+                errors.append("Drug " + str(drug_id) + ": " + stock_errors[drug_id])
+
+        if len(errors) > 0:
+            for error in errors:
+                messages.error(request, error)
+            return render(request, "bulk_stock_update.html", {"current_user": current_user, "entries": text})
+
+        if len(out_of_stock) > 0:
+            app_url = request.build_absolute_uri(reverse("drugs"))
+            models.enqueue_out_of_stock_notifications(out_of_stock, app_url)
+
+        messages.success(request, "Stock updated for " + str(len(entries)) + " entries.")
+        return redirect("bulk_update_stock")
+
+    context = {
+        "current_user": current_user,
+        "entries": "",
+    }
+    return render(request, "bulk_stock_update.html", context)
+
+
+def import_catalog(request):
+    if "user_id" not in request.session:
+        return redirect("login")
+
+    current_user = request.current_user
+    if current_user.role != "admin":
+        return redirect("drugs")
+
+    if request.method == "POST":
+        if "catalog_file" not in request.FILES:
+            messages.error(request, "Choose a catalog file to import.")
+            return redirect("import_catalog")
+
+        upload = request.FILES["catalog_file"]
+        if not catalog_import.is_utf8(upload.file):
+            messages.error(request, "The catalog file must be UTF-8 encoded text; nothing was imported.")
+            return redirect("import_catalog")
+
+        file_format = "csv"
+        if upload.name.endswith((".ndjson", ".jsonl")):
+            file_format = "ndjson"
+
+        stream = catalog_import.open_text_stream(upload.file)
+        result = catalog_import.import_catalog(stream, file_format, current_user.id)
+
+        for error in result["errors"]:
+            messages.error(request, error)
+        messages.success(
+            request,
+            "Imported " + str(result["imported"]) + " drugs, skipped " + str(result["skipped"])
+            + " rows, created " + str(result["categories_created"]) + " categories."
+        )
+        return redirect("import_catalog")
+
+    context = {
+        "current_user": current_user,
+    }
+    return render(request, "import_catalog.html", context)
+
+
 def edit_drug(request, drug_id):
     if "user_id" not in request.session:
         return redirect("login")
 
-    current_user = models.get_current_user(request.session["user_id"])
+    current_user = request.current_user
     if current_user.role != "admin":
         return redirect("drug_details", drug_id=drug_id)
     
@@ -497,7 +1021,7 @@ def user_management(request):
     if "user_id" not in request.session:
         return redirect("login")
 
-    current_user = models.get_current_user(request.session["user_id"])
+    current_user = request.current_user
     if current_user.role != "admin":
         return redirect("drugs")
 
@@ -514,7 +1038,7 @@ def update_user_admin(request, user_id):
     if "user_id" not in request.session:
         return redirect("login")
 
-    current_user = models.get_current_user(request.session["user_id"])
+    current_user = request.current_user
     if current_user.role != "admin":
         return redirect("drugs")
 
@@ -532,11 +1056,18 @@ def update_user_admin(request, user_id):
     return redirect("user_management")
 
 
-def profile(request):
-    if "user_id" not in request.session:
+async def profile(request):
+    if await sync_to_async(get_session_user_id)(request) is None:
         return redirect("login")
 
-    current_user = models.get_current_user(request.session["user_id"])
+    if request.method == "POST" and request.POST["form_type"] == "password":
+        return await change_password(request)
+
+    return await sync_to_async(profile_page)(request)
+
+
+def profile_page(request):
+    current_user = request.current_user
 
     if request.method == "POST":
         form_type = request.POST["form_type"]
@@ -551,30 +1082,34 @@ def profile(request):
             models.update_user_name(current_user.id, request.POST)
             return redirect("profile")
 
-        if form_type == "password":
-            errors = models.User.objects.validate_password_change(request.POST)
-            if len(errors) > 0:
-                for key in errors:
-                    messages.error(request, errors[key])
-                return redirect("profile")
-
-            if not bcrypt.checkpw(request.POST["current_password"].encode(), current_user.password_hash.encode()):
-                messages.error(request, "Current password is incorrect.")
-                return redirect("profile")
-
-            models.update_user_password(current_user.id, request.POST["new_password"])
-            return redirect("profile")
-
     context = {
         "current_user": current_user
     }
     return render(request, "profile.html", context)
 
 
+async def change_password(request):
+    errors = models.User.objects.validate_password_change(request.POST)
+    if len(errors) > 0:
+        for key in errors:
+            messages.error(request, errors[key])
+        return redirect("profile")
+
+    user_id = await sync_to_async(get_session_user_id)(request)
+    user = await sync_to_async(models.get_current_user)(user_id)
+    if not await passwords.acheck_password(request.POST["current_password"], user.password_hash):
+        messages.error(request, "Current password is incorrect.")
+        return redirect("profile")
+
+    pw_hash = await passwords.ahash_password(request.POST["new_password"])
+    await sync_to_async(models.set_user_password_hash)(user.id, pw_hash)
+    return redirect("profile")
+
+
 def about(request):
     if "user_id" not in request.session:
         return redirect("login")
-    current_user = models.get_current_user(request.session["user_id"])
+    current_user = request.current_user
     context = {
         "current_user": current_user
     }
@@ -22,6 +22,84 @@ load_dotenv(BASE_DIR / ".env")
 SENDGRID_API_KEY = os.environ.get("SENDGRID_API_KEY")
 DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL", "noreply@pharmashelf.local")
 
+# "sendgrid" delivers notifications through SendGrid, "stub" only logs them
+NOTIFICATION_TRANSPORT = os.environ.get(
+    "NOTIFICATION_TRANSPORT",
+    "sendgrid" if SENDGRID_API_KEY is not None else "stub"
+)
+
+# bcrypt work factor for new hashes; existing hashes are upgraded on login
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+# threads that run bcrypt for the async login, signup and profile views; half
+# the cores by default, so a login burst leaves the rest for browsing
+BCRYPT_MAX_WORKERS = int(os.environ.get("BCRYPT_MAX_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+# failed logins allowed per email and per client IP inside the sliding window
+# before that key is locked out; repeated lockouts double up to the maximum
+LOGIN_THROTTLE_WINDOW_SECONDS = int(os.environ.get("LOGIN_THROTTLE_WINDOW_SECONDS", "900"))
+LOGIN_THROTTLE_EMAIL_LIMIT = int(os.environ.get("LOGIN_THROTTLE_EMAIL_LIMIT", "5"))
+LOGIN_THROTTLE_IP_LIMIT = int(os.environ.get("LOGIN_THROTTLE_IP_LIMIT", "20"))
+LOGIN_LOCKOUT_BASE_SECONDS = int(os.environ.get("LOGIN_LOCKOUT_BASE_SECONDS", "60"))
+LOGIN_LOCKOUT_MAX_SECONDS = int(os.environ.get("LOGIN_LOCKOUT_MAX_SECONDS", "3600"))
+# reverse proxies (addresses or networks, comma separated) whose
+# X-Forwarded-For header is trusted for the client IP the throttle counts
+TRUSTED_PROXIES = [p.strip() for p in os.environ.get("TRUSTED_PROXIES", "").split(",") if p.strip()]
+
+# Backend behind pharma_shelf_app.caching, the login throttle and the
+# template fragment cache. "file" (the default) shares entries between the
+# workers and management commands of one box; "memcached" and "database"
+# share them across boxes, and memcached is the one with atomic counters.
+# "locmem" is per process, so only right for a single worker. A dotted path
+# selects any other Django cache backend.
+CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+    "memcached": "django.core.cache.backends.memcached.PyMemcacheCache",
+    "database": "django.core.cache.backends.db.DatabaseCache",
+}
+CACHE_DEFAULT_LOCATIONS = {
+    "locmem": "pharma-shelf",
+    "file": str(BASE_DIR / "cache"),
+    "memcached": "127.0.0.1:11211",
+    "database": "pharma_shelf_cache",
+}
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "file")
+
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS.get(CACHE_BACKEND, CACHE_BACKEND),
+        "LOCATION": os.environ.get("CACHE_LOCATION", CACHE_DEFAULT_LOCATIONS.get(CACHE_BACKEND, "")),
+        # default TTL for entries stored without one
+        "TIMEOUT": int(os.environ.get("CACHE_TIMEOUT", "300")),
+        # locmem, file and database evict once they hold this many entries
+        # (locmem least recently used first)
+        "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("CACHE_MAX_ENTRIES", "10000"))},
+    }
+}
+if CACHE_BACKEND == "memcached":
+    # memcached evicts by its own memory limit
+    CACHES["default"]["OPTIONS"] = {}
+
+# Keep database connections open between requests for this many seconds
+# instead of reconnecting on every request (0 closes them after each one).
+# With health checks on, a kept connection that has been idle for
+# DB_HEALTH_CHECK_IDLE_SECONDS is pinged before it is reused and replaced if
+# the server has dropped it.
+DB_CONN_MAX_AGE = int(os.environ.get("DB_CONN_MAX_AGE", "60"))
+DB_CONN_HEALTH_CHECKS = os.environ.get("DB_CONN_HEALTH_CHECKS", "1") == "1"
+DB_HEALTH_CHECK_IDLE_SECONDS = int(os.environ.get("DB_HEALTH_CHECK_IDLE_SECONDS", "10"))
+
+# Connections one server process may hold, from the share of MySQL's
+# max_connections given to the app split across the server's worker
+# processes (WEB_CONCURRENCY, as read by gunicorn and uvicorn). Under ASGI
+# one of them belongs to the thread running the sync code and the rest to
+# the pool the async views run their queries on; under WSGI size the
+# worker's threads to fit.
+DB_CONNECTION_BUDGET = int(os.environ.get("DB_CONNECTION_BUDGET", "100"))
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+DB_CONNECTIONS_PER_WORKER = max(2, DB_CONNECTION_BUDGET // WEB_CONCURRENCY)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", str(min(32, DB_CONNECTIONS_PER_WORKER - 1))))
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
@@ -29,7 +107,9 @@ DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL", "noreply@pharmashelf.l
 SECRET_KEY = 'django-insecure-^cdi)@j5_vvhq*jl0zd$8@2qeu^2jrb@zs%tpxax--pg7bj3*b'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# With DEBUG on, {% static %} links the unhashed files, so production needs
+# DJANGO_DEBUG=0 for the long-cached hashed assets to be used.
+DEBUG = os.environ.get("DJANGO_DEBUG", "1") == "1"
 
 ALLOWED_HOSTS = ["pharmashelf.daliakassaboghly.online","127.0.0.1","localhost",]
 
@@ -48,10 +128,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'pharma_shelf_app.middleware.StaticAssetMiddleware',
+    'pharma_shelf_app.middleware.ReplicaReadMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'pharma_shelf_app.middleware.CurrentUserMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -79,19 +162,51 @@ WSGI_APPLICATION = 'pharma_shelf_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.mysql",
-        "NAME": os.environ["DB_NAME"],
-        "USER": os.environ["DB_USER"],
-        "PASSWORD": os.environ["DB_PASSWORD"],
-        "HOST": os.environ["DB_HOST"],
-        "PORT": os.environ["DB_PORT"],
-        "OPTIONS": {
-            "charset": "utf8mb4"
+# "mysql", or "sqlite3" for local work, where DB_NAME and each DB_REPLICAS
+# entry are database file paths
+DB_ENGINE = os.environ.get("DB_ENGINE", "mysql")
+
+if DB_ENGINE == "sqlite3":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get("DB_NAME", str(BASE_DIR / "db.sqlite3")),
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.mysql",
+            "NAME": os.environ["DB_NAME"],
+            "USER": os.environ["DB_USER"],
+            "PASSWORD": os.environ["DB_PASSWORD"],
+            "HOST": os.environ["DB_HOST"],
+            "PORT": os.environ["DB_PORT"],
+            "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+            "OPTIONS": {
+                "charset": "utf8mb4"
+            }
         }
     }
-}
+
+# Read replicas, comma separated: "host" or "host:port" for MySQL, file
+# paths for SQLite. GET and HEAD requests read from them; writes, and reads
+# for DB_REPLICA_LAG_SECONDS after any write, go to the primary.
+DATABASE_REPLICAS = []
+for index, replica in enumerate([r.strip() for r in os.environ.get("DB_REPLICAS", "").split(",") if r.strip()]):
+    alias = "replica" + str(index + 1)
+    DATABASES[alias] = dict(DATABASES["default"], TEST={"MIRROR": "default"})
+    if DB_ENGINE == "sqlite3":
+        DATABASES[alias]["NAME"] = replica
+    else:
+        host, _, port = replica.partition(":")
+        DATABASES[alias]["HOST"] = host
+        DATABASES[alias]["PORT"] = port or DATABASES["default"]["PORT"]
+    DATABASE_REPLICAS.append(alias)
+
+DB_REPLICA_LAG_SECONDS = int(os.environ.get("DB_REPLICA_LAG_SECONDS", "5"))
+
+DATABASE_ROUTERS = ["pharma_shelf_app.db_router.PrimaryReplicaRouter"]
 
 
 # Password validation
@@ -130,6 +245,12 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# `python manage.py collectstatic` writes content-hashed copies of every
+# asset plus .br/.gz variants here; StaticAssetMiddleware serves them with
+# far-future cache headers and byte ranges
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+STATICFILES_STORAGE = 'pharma_shelf_app.storage.PrecompressedManifestStaticFilesStorage'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 